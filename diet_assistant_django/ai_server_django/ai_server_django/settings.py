@@ -145,3 +145,52 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # 跨域请求配置
 CORS_ORIGIN_ALLOW_ALL = True  # 允许所有域名跨域请求
 
+# 聊天前置阶段超时配置（秒）：主题命名、RAG检索并发执行，超时后降级处理
+CHAT_STAGE_TIMEOUTS = {
+    'theme_name': 3,  # 主题命名（qwen-flash）
+    'rag': 5,  # RAG检索（向量召回 + 重排序）
+}
+# 聊天前置阶段线程数：每个聊天请求最多同时占用 2 个线程，建议设为 2 × 单进程最大并发聊天数
+CHAT_STAGE_WORKERS = 32
+
+# 语义回答缓存配置：相同/相近的提问直接复用回答（默认关闭）
+SEMANTIC_CACHE = {
+    'enabled': False,  # 是否开启
+    'threshold': 0.95,  # 命中所需的最小余弦相似度
+    'ttl': 3600,  # 缓存有效期（秒）
+    'max_entries': 2000,  # 最大缓存条数（LRU 淘汰）
+}
+
+# 已删除对话的保留天数：超过后由 python manage.py purge_deleted 物理删除
+DELETED_RETENTION_DAYS = 30
+
+# 对话写入缓冲配置：对话记录先进入内存队列，由后台线程批量写入（默认关闭）
+CONVERSATION_WRITE_BEHIND = {
+    'enabled': False,  # 是否开启
+    'flush_interval': 0.5,  # 最长刷新间隔（秒）
+    'max_batch': 200,  # 队列达到该条数时立即写入
+}
+
+# 上传图片预处理配置：压缩后的图片用于视觉模型对话
+IMAGE_PIPELINE = {
+    'max_side': 1024,  # 压缩后最长边（像素）
+    'quality': 85,  # JPEG 压缩质量
+    'cache_size': 128,  # 内存中缓存的 base64 data URI 个数
+    'workers': 2,  # 上传后后台预处理图片的线程数（独立线程池，不占用聊天前置阶段线程）
+}
+
+# 文件上传限制：只接受图片（按文件头校验），超过大小限制的请求在读取请求体前拒绝
+UPLOAD_MAX_SIZE = 10 * 1024 * 1024  # 单个文件最大字节数（10MB）
+UPLOAD_TEMP_DIR = BASE_DIR / 'upload_tmp'  # 接收中的临时文件目录（不能放在 static 下，建议与 static/uploads 同一文件系统）
+
+# 模型路由配置：简单提问（查热量等）使用 qwen-flash，复杂提问（食谱、计划、疾病饮食等）使用 qwen-plus
+# 未列出的配置项（关键词列表等）使用 diet_asst/routing.py 中 DEFAULT_POLICY 的默认值
+MODEL_ROUTER = {
+    'enabled': True,  # 是否开启（关闭时文本提问全部使用 complex_model）
+    'simple_model': 'qwen-flash',  # 简单提问使用的模型
+    'complex_model': 'qwen-plus',  # 复杂提问使用的模型
+    'default_route': 'complex',  # 规则无法判断时的路由
+    'max_simple_chars': 40,  # 超过该字数的提问视为复杂
+    'min_rag_score': 2.0,  # 知识库命中可信的最低重排序得分
+    'log_every': 200,  # 每 N 次请求打印一次分路由延迟/token 统计（0 表示不打印）
+}
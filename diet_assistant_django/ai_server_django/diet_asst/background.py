@@ -0,0 +1,57 @@
+"""
+后台任务模块：按键去重的后台任务执行器
+
+功能说明：
+- 同一个键（如主题 id、(主题, 图片)）同时只有一个任务在执行
+- 执行期间又提交了同一个键的任务时，不重复排队，只标记为需要再跑一轮（合并多次提交）
+- 任务在独立线程池中执行，不阻塞请求；异常只打印日志，结束时释放后台线程的数据库连接
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.db import close_old_connections
+
+
+# =================================================
+# KeyedRunner：按键合并的后台任务执行器
+# =================================================
+class KeyedRunner:
+    def __init__(self, name, label, max_workers=2):
+        """
+        Args:
+            name (str): 线程名前缀
+            label (str): 任务名称（用于失败日志）
+            max_workers (int): 线程数
+        """
+        self.label = label
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        # 正在执行的任务：键 -> 执行期间是否又有新的提交（需要再跑一轮）
+        self._running = {}
+        self._lock = threading.Lock()
+
+    def schedule(self, key, fn, *args):
+        """提交后台任务 fn(*args)（同一个键同时只有一个任务在执行）"""
+        with self._lock:
+            if key in self._running:
+                # 已有任务在执行：标记为需要再跑一轮
+                self._running[key] = True
+                return
+            self._running[key] = False
+        self._executor.submit(self._worker, key, fn, *args)
+
+    def _worker(self, key, fn, *args):
+        try:
+            while True:
+                try:
+                    fn(*args)
+                except Exception as e:
+                    print(f"后台{self.label}失败: {e}")
+                with self._lock:
+                    # 执行期间又有新的提交：再跑一轮；否则结束
+                    if not self._running.get(key):
+                        self._running.pop(key, None)
+                        break
+                    self._running[key] = False
+        finally:
+            # 后台线程不经过请求周期，需要手动释放过期的数据库连接
+            close_old_connections()
@@ -0,0 +1,122 @@
+"""
+图片上下文模块：为上传的图片生成一次文字描述，供后续轮次复用
+
+功能说明：
+- 带图片的提问保存后，由后台线程调用视觉模型生成简短的图片描述，保存到 Conversation.image_caption
+- 后续轮次加载历史对话时，把图片描述以文字形式带入上下文：
+  追问图片内容时无需重新上传，也不必每轮重复发送 base64 图片和调用视觉模型
+- 同一张图片（相同 image_url，内容寻址存储下即相同内容）只生成一次描述：
+  同一主题内从数据库复用，跨主题从进程内 LRU 缓存复用
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from .background import KeyedRunner
+from .models import Conversation
+from .uploads import digest_from_url
+from .writebehind import flush_conversations
+
+# 图片描述使用的视觉模型
+CAPTION_MODEL = "qwen3-vl-plus"
+# 图片描述提示词
+CAPTION_PROMPT = (
+    "请用不超过150字客观描述这张图片：图中有哪些食物/饮品/包装或营养成分表，"
+    "估计的份量，以及图片中可见的文字和数字。只输出描述，不要给出建议。"
+)
+
+# 进程内缓存的图片描述条数（跨主题复用）
+CAPTION_CACHE_SIZE = 256
+
+# 后台描述任务：视觉模型调用不阻塞请求，同一 (主题, 图片) 同时只有一个任务
+_caption_runner = KeyedRunner("caption", "图片描述")
+# 已生成的图片描述：image_url -> 描述（LRU）
+_captions = OrderedDict()
+_captions_lock = threading.Lock()
+
+
+# =================================================
+# 调用视觉模型生成图片描述
+# =================================================
+def generate_caption(qwen, image_pipeline, image_url):
+    """
+    Args:
+        qwen (QwenLLM): 模型调用实例
+        image_pipeline (ImagePipeline): 图片预处理实例（使用压缩版本）
+        image_url (str): 图片地址（/static/uploads/...）
+    Returns:
+        str | None: 图片描述；调用失败时返回 None
+    """
+    image_data = image_pipeline.data_uri(
+        os.path.join(settings.BASE_DIR, image_url[1:]),
+        digest=digest_from_url(image_url),
+    )
+    return qwen.inference_text(
+        messages=[{
+            'role': 'user',
+            'content': [
+                {'type': 'image_url', 'image_url': {'url': image_data}},
+                {'type': 'text', 'text': CAPTION_PROMPT},
+            ],
+        }],
+        model=CAPTION_MODEL,
+        max_tokens=300,
+    )
+
+
+# =================================================
+# 后台任务：为图片生成描述并写入对话记录
+# =================================================
+def refresh_image_caption(qwen, image_pipeline, theme_id, user_id, image_url):
+    # 提问记录可能仍在写入缓冲队列中
+    flush_conversations(theme_id)
+    theme_images = Conversation.objects.filter(
+        user_id=user_id,
+        theme_id=theme_id,
+        image_url=image_url,
+    )
+    pending = theme_images.filter(image_caption='')
+    if not pending.exists():
+        return
+
+    # 同一张图片已有描述：优先复用（同一主题内的记录 → 进程内缓存），都没有时才调用视觉模型
+    caption = theme_images.exclude(image_caption='').values_list('image_caption', flat=True).first()
+    with _captions_lock:
+        caption = caption or _captions.get(image_url)
+    if caption is None:
+        caption = generate_caption(qwen, image_pipeline, image_url)
+        if caption is None:
+            return  # 失败时保持为空，下次带该图片提问时重试
+    with _captions_lock:
+        _captions[image_url] = caption
+        _captions.move_to_end(image_url)
+        while len(_captions) > CAPTION_CACHE_SIZE:
+            _captions.popitem(last=False)
+    pending.update(image_caption=caption)
+
+
+def schedule_caption(qwen, image_pipeline, theme_id, user_id, image_url):
+    """
+    提交后台图片描述任务（同一主题的同一张图片同时只有一个任务在执行）
+
+    Args:
+        qwen (QwenLLM): 模型调用实例
+        image_pipeline (ImagePipeline): 图片预处理实例
+        theme_id (int): 对话主题 id
+        user_id (int): 用户 id
+        image_url (str): 图片地址
+    """
+    _caption_runner.schedule(
+        (theme_id, image_url),
+        refresh_image_caption, qwen, image_pipeline, theme_id, user_id, image_url,
+    )
+
+
+# =================================================
+# 上下文拼接：对话内容 + 图片描述
+# =================================================
+def with_caption(content, image_caption):
+    if not image_caption:
+        return content
+    return f"{content}\n【用户上传的图片内容】{image_caption}"
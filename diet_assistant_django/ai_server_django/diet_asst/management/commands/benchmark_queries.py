@@ -0,0 +1,191 @@
+"""
+热点查询性能测试命令：生成大规模合成数据，统计 assistant / history / continue_history 的查询延迟
+
+用法：
+    python manage.py benchmark_queries --users 200 --themes 20 --messages 50
+    python manage.py benchmark_queries --compare   # 先删除复合索引测一遍，再恢复索引测一遍
+
+说明：
+- 合成数据使用独立的 user_id 区间（SYNTHETIC_USER_BASE 起），测试结束后自动清理（--keep 保留）
+- 三类查询与 views.py 中的查询条件、排序一致，只统计数据库耗时，不调用大模型
+"""
+
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from diet_asst.memory import load_recent_history
+from diet_asst.models import Conversation, Theme
+from diet_asst.pagination import fetch_page
+from diet_asst.routing import percentiles
+
+# 合成数据的 user_id 起点（远离真实用户 id）
+SYNTHETIC_USER_BASE = 1_900_000_000
+# 批量写入大小
+BULK_SIZE = 5000
+# 历史主题列表 / 历史对话详情每页条数
+HISTORY_PAGE_SIZE = 20
+
+
+# =================================================
+# 与 views.py 一致的三类热点查询
+# =================================================
+def query_assistant(user_id, theme_id):
+    # 每轮对话：读取主题 + 加载摘要和最近的对话窗口
+    theme = Theme.objects.filter(id=theme_id, user_id=user_id).first()
+    return theme, load_recent_history(theme, user_id, theme_id)
+
+
+def query_history(user_id):
+    # 历史主题列表（第一页）
+    themes = Theme.objects.filter(user_id=user_id, is_deleted=0).order_by(
+        '-create_time', '-id'
+    ).values('id', 'theme_name', 'create_time')
+    return fetch_page(themes, HISTORY_PAGE_SIZE)
+
+
+def query_continue_history(user_id, theme_id):
+    # 历史对话详情（最近一页）
+    chats = Conversation.objects.filter(
+        theme_id=theme_id,
+        user_id=user_id,
+        is_deleted=0,
+    ).values('id', 'role', 'content', 'image_url')
+    return fetch_page(chats.order_by('-id'), HISTORY_PAGE_SIZE)
+
+
+class Command(BaseCommand):
+    help = '生成合成对话数据，统计 assistant / history / continue_history 查询延迟'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200, help='合成用户数')
+        parser.add_argument('--themes', type=int, default=20, help='每个用户的主题数')
+        parser.add_argument('--messages', type=int, default=50, help='每个主题的对话条数')
+        parser.add_argument('--rounds', type=int, default=200, help='每类查询的测试次数')
+        parser.add_argument('--seed', type=int, default=42, help='随机种子')
+        parser.add_argument('--compare', action='store_true', help='对比删除复合索引前后的延迟')
+        parser.add_argument('--keep', action='store_true', help='测试结束后保留合成数据')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        try:
+            samples = self.seed(options['users'], options['themes'], options['messages'], rng)
+            if options['compare']:
+                with self.without_indexes():
+                    self.run('无复合索引', samples, options['rounds'], rng)
+            self.run('当前索引', samples, options['rounds'], rng)
+        finally:
+            if not options['keep']:
+                self.cleanup(options['users'])
+
+    # =================================================
+    # 生成合成数据
+    # =================================================
+    def seed(self, users, themes, messages, rng):
+        self.cleanup(users)
+        start = time.perf_counter()
+        now = timezone.now()
+        user_ids = range(SYNTHETIC_USER_BASE, SYNTHETIC_USER_BASE + users)
+
+        theme_rows = [
+            Theme(
+                user_id=user_id,
+                theme_name=f'合成主题{i}',
+                create_time=now,
+                update_time=now,
+                is_deleted=1 if rng.random() < 0.1 else 0,  # 约 10% 已删除
+            )
+            for user_id in user_ids for i in range(themes)
+        ]
+        Theme.objects.bulk_create(theme_rows, batch_size=BULK_SIZE)
+        # 部分数据库的 bulk_create 不回填主键，重新查询主题 id
+        theme_pairs = list(Theme.objects.filter(
+            user_id__gte=SYNTHETIC_USER_BASE,
+            user_id__lt=SYNTHETIC_USER_BASE + users,
+        ).values_list('user_id', 'id'))
+
+        batch, total = [], 0
+        for user_id, theme_id in theme_pairs:
+            for i in range(messages):
+                batch.append(Conversation(
+                    theme_id=theme_id,
+                    user_id=user_id,
+                    role='user' if i % 2 == 0 else 'assistant',
+                    content='合成对话内容：' + '蔬菜水果蛋白质' * rng.randint(2, 30),
+                ))
+                if len(batch) >= BULK_SIZE:
+                    Conversation.objects.bulk_create(batch)
+                    total += len(batch)
+                    batch = []
+        Conversation.objects.bulk_create(batch)
+        total += len(batch)
+
+        self.stdout.write(
+            f'✅ 合成数据: {len(theme_pairs)} 个主题 | {total} 条对话 | '
+            f'耗时 {time.perf_counter() - start:.1f}s'
+        )
+        return theme_pairs
+
+    def cleanup(self, users):
+        user_range = (SYNTHETIC_USER_BASE, SYNTHETIC_USER_BASE + users - 1)
+        Conversation.objects.filter(user_id__range=user_range).delete()
+        Theme.objects.filter(user_id__range=user_range).delete()
+
+    # =================================================
+    # 临时删除复合索引（对比用），结束后恢复
+    # =================================================
+    def without_indexes(self):
+        command = self
+
+        class _WithoutIndexes:
+            def __enter__(self):
+                with connection.schema_editor() as editor:
+                    for model in (Conversation, Theme):
+                        for index in model._meta.indexes:
+                            editor.remove_index(model, index)
+                command.stdout.write('🔧 已临时删除复合索引')
+
+            def __exit__(self, *exc):
+                with connection.schema_editor() as editor:
+                    for model in (Conversation, Theme):
+                        for index in model._meta.indexes:
+                            editor.add_index(model, index)
+                command.stdout.write('🔧 已恢复复合索引')
+                return False
+
+        return _WithoutIndexes()
+
+    # =================================================
+    # 统计延迟
+    # =================================================
+    def run(self, label, samples, rounds, rng):
+        picks = [rng.choice(samples) for _ in range(rounds)]
+        cases = [
+            ('assistant', lambda u, t: query_assistant(u, t)),
+            ('history', lambda u, t: query_history(u)),
+            ('continue_history', lambda u, t: query_continue_history(u, t)),
+        ]
+        self.stdout.write(f'\n📊 {label}')
+        for name, fn in cases:
+            latencies = []
+            for user_id, theme_id in picks:
+                start = time.perf_counter()
+                fn(user_id, theme_id)
+                latencies.append(time.perf_counter() - start)
+            latency_ms = percentiles(latencies, ndigits=2)
+            self.stdout.write(f'  {name}: p50={latency_ms["p50"]:.2f}ms | p95={latency_ms["p95"]:.2f}ms | '
+                              f'样本数={len(latencies)}')
+
+        # 查询计划：确认是否命中复合索引
+        user_id, theme_id = picks[0]
+        plans = [
+            ('Conversation', Conversation.objects.filter(
+                user_id=user_id, theme_id=theme_id, is_deleted=0).order_by('-id')[:HISTORY_PAGE_SIZE + 1]),
+            ('Theme', Theme.objects.filter(user_id=user_id, is_deleted=0).order_by(
+                '-create_time', '-id')[:HISTORY_PAGE_SIZE + 1]),
+        ]
+        for name, queryset in plans:
+            self.stdout.write(f'  🔍 {name} 查询计划: {queryset.explain()}')
@@ -0,0 +1,204 @@
+"""
+模型路由离线评估命令：用已记录的用户提问评估路由策略
+
+用法：
+    python manage.py evaluate_router                          # 最近 500 条提问的路由分布（只用启发式规则）
+    python manage.py evaluate_router --rag                    # 同时计算检索重排序得分（需启动 Chroma 并配置重排序模型）
+    python manage.py evaluate_router --max-chars 30 --min-rag-score 3
+    python manage.py evaluate_router --rag --replay 30        # 抽样回放：简单提问分别用两个模型回答并对比
+
+说明：
+- 提问来自 Conversation 表中未删除、不带图片的用户提问（相同提问只计一次）
+- 路由策略为 settings.MODEL_ROUTER，命令行参数只在本次评估中覆盖，不修改配置
+- 回放只针对路由到简单模型的提问：记录两个模型的延迟和 token 数，
+  再由复杂模型判断简单模型的回答是否与自己的回答同样正确（一致率越高说明降级越安全）
+"""
+
+import random
+import statistics
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from diet_asst.models import Conversation
+from diet_asst.pagination import iter_pages
+from diet_asst.routing import get_policy, percentiles, route_query
+
+# 回放时使用的系统提示（与 views.build_chat_context 一致）
+SYSTEM_PROMPT = '你叫柠柠，是一个充满元气的专业营养师，可以根据用户的需求提供饮食建议。'
+# 判断简单模型回答质量的提示词
+JUDGE_PROMPT = '''
+请判断【候选回答】是否与【参考回答】同样正确，并且足以回答【用户提问】。
+只输出“是”或“否”。
+
+【用户提问】
+{query}
+
+【参考回答】
+{reference}
+
+【候选回答】
+{candidate}
+'''
+
+
+class Command(BaseCommand):
+    help = '用已记录的用户提问离线评估模型路由策略'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=500, help='评估的提问条数（最近的提问优先）')
+        parser.add_argument('--rag', action='store_true', help='计算检索重排序得分（否则只用启发式规则）')
+        parser.add_argument('--max-chars', type=int, help='覆盖 max_simple_chars')
+        parser.add_argument('--min-rag-score', type=float, help='覆盖 min_rag_score')
+        parser.add_argument('--default-route', choices=['simple', 'complex'], help='覆盖 default_route')
+        parser.add_argument('--replay', type=int, default=0, help='抽样回放的简单提问条数（会调用模型）')
+        parser.add_argument('--seed', type=int, default=42, help='回放抽样的随机种子')
+
+    def handle(self, *args, **options):
+        overrides = {
+            key: options[option]
+            for key, option in (
+                ('max_simple_chars', 'max_chars'),
+                ('min_rag_score', 'min_rag_score'),
+                ('default_route', 'default_route'),
+            )
+            if options[option] is not None
+        }
+        policy = get_policy(overrides)
+        policy['enabled'] = True  # 评估的是策略本身，与线上是否开启无关
+
+        queries = self.load_queries(options['limit'])
+        if not queries:
+            self.stdout.write('⚠️ 没有可评估的用户提问')
+            return
+        self.stdout.write(f'✅ 加载 {len(queries)} 条用户提问 | 策略覆盖项: {overrides or "无"}')
+
+        rag = None
+        if options['rag']:
+            from utils.RAGSystem import RAGSystem
+            rag = RAGSystem()
+
+        samples = []
+        for query in queries:
+            rag_text, rag_scores = self.retrieve(rag, query) if rag is not None else ("", [])
+            decision = route_query(query, rag_scores, policy=policy)
+            samples.append((query, rag_text, decision))
+
+        self.report_routes(samples)
+        if options['replay']:
+            simple = [sample for sample in samples if sample[2]['route'] == 'simple']
+            rng = random.Random(options['seed'])
+            picked = rng.sample(simple, min(options['replay'], len(simple)))
+            self.replay(picked, policy)
+
+    # =================================================
+    # 读取已记录的用户提问
+    # =================================================
+    def load_queries(self, limit):
+        rows = Conversation.objects.filter(
+            Q(image_url='') | Q(image_url__isnull=True),  # 带图片的提问使用视觉模型，不参与路由
+            role='user',
+            is_deleted=0,
+        ).order_by('-id').values('id', 'content')
+
+        queries, seen = [], set()
+        # 按 id 逐页读取（不使用 iterator()：MySQL 驱动会先把整个结果集读入内存）
+        for row in iter_pages(rows, lambda row: Q(id__lt=row['id']), size=1000):
+            query = row['content'].strip()
+            if query and query not in seen:
+                seen.add(query)
+                queries.append(query)
+                if len(queries) >= limit:
+                    break
+        return queries
+
+    def retrieve(self, rag, query):
+        try:
+            chunks = rag.retrieval_chunks(query)
+        except Exception as e:
+            self.stdout.write(f'⚠️ 检索失败（按无检索结果处理）: {e}')
+            return "", []
+        return "\n".join(chunks["documents"][:10]), chunks.get("scores", [])
+
+    # =================================================
+    # 路由分布
+    # =================================================
+    def report_routes(self, samples):
+        routes = Counter(decision['route'] for _, _, decision in samples)
+        reasons = Counter((decision['route'], decision['reason']) for _, _, decision in samples)
+        total = len(samples)
+        for route, count in routes.most_common():
+            self.stdout.write(f'📊 {route}: {count} 条（{count / total:.1%}）')
+            for (reason_route, reason), reason_count in reasons.most_common():
+                if reason_route == route:
+                    self.stdout.write(f'    - {reason}: {reason_count}')
+            examples = [query for query, _, decision in samples if decision['route'] == route][:3]
+            for query in examples:
+                self.stdout.write(f'    例: {query[:40]}')
+
+    # =================================================
+    # 抽样回放：两个模型分别回答，复杂模型判断一致性
+    # =================================================
+    def replay(self, samples, policy):
+        if not samples:
+            self.stdout.write('⚠️ 没有路由到简单模型的提问，跳过回放')
+            return
+        from utils.QwenLLM import QwenLLM
+        client = QwenLLM().client
+
+        results = {policy['simple_model']: [], policy['complex_model']: []}
+        agreed = 0
+        for query, rag_text, _ in samples:
+            messages = [{'role': 'system', 'content': SYSTEM_PROMPT}]
+            if rag_text:
+                messages.append({'role': 'system', 'content': f'以下是与用户问题相关的参考资料，仅供你回答时参考。\n如果无关请忽略。\n【参考资料】\n{rag_text}'})
+            messages.append({'role': 'user', 'content': query})
+
+            answers = {}
+            for model in results:
+                try:
+                    answers[model], latency, tokens = self.complete(client, model, messages)
+                except Exception as e:
+                    self.stdout.write(f'⚠️ {model} 调用失败: {e}')
+                    break
+                results[model].append((latency, tokens))
+            else:
+                verdict = self.judge(client, policy['complex_model'], query,
+                                     answers[policy['complex_model']], answers[policy['simple_model']])
+                agreed += verdict
+
+        for model, rows in results.items():
+            if not rows:
+                continue
+            latency_ms = percentiles([latency for latency, _ in rows])
+            tokens = statistics.mean(tokens for _, tokens in rows)
+            self.stdout.write(f'⏱️ {model}: p50={latency_ms["p50"]:.0f}ms | p95={latency_ms["p95"]:.0f}ms | '
+                              f'平均 token={tokens:.0f} | 样本数={len(rows)}')
+        judged = min(len(rows) for rows in results.values())
+        if judged:
+            self.stdout.write(f'✅ 简单模型回答被判定为同样正确: {agreed}/{judged}（{agreed / judged:.1%}）')
+
+    @staticmethod
+    def complete(client, model, messages):
+        start = time.perf_counter()
+        completion = client.chat.completions.create(model=model, messages=messages, max_tokens=2048, temperature=0.7)
+        latency = time.perf_counter() - start
+        tokens = completion.usage.total_tokens if completion.usage else 0
+        return completion.choices[0].message.content, latency, tokens
+
+    def judge(self, client, model, query, reference, candidate):
+        try:
+            completion = client.chat.completions.create(
+                model=model,
+                messages=[{'role': 'user', 'content': JUDGE_PROMPT.format(
+                    query=query, reference=reference, candidate=candidate,
+                )}],
+                max_tokens=5,
+                temperature=0,
+            )
+        except Exception as e:
+            self.stdout.write(f'⚠️ 判断失败: {e}')
+            return False
+        return completion.choices[0].message.content.strip().startswith('是')
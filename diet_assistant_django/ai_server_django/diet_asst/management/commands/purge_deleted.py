@@ -0,0 +1,61 @@
+"""
+已删除数据清理命令：物理删除超过保留期的逻辑删除记录
+
+用法：
+    python manage.py purge_deleted                  # 使用 settings.DELETED_RETENTION_DAYS
+    python manage.py purge_deleted --days 7 --chunk-size 500 --sleep 0.2
+    python manage.py purge_deleted --dry-run        # 只统计，不删除
+
+建议通过 cron 等定时任务在低峰期执行，例如：
+    0 4 * * * cd /path/to/ai_server_django && python manage.py purge_deleted
+
+说明：
+- 只删除 is_deleted=1 且 delete_time 早于保留期的记录
+- 按主键顺序分块删除（每块一个短事务），不会长时间锁表；块之间可休眠以降低数据库压力
+"""
+
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from diet_asst.models import Conversation, Theme
+
+
+class Command(BaseCommand):
+    help = '物理删除超过保留期的已删除主题和对话记录'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=getattr(settings, 'DELETED_RETENTION_DAYS', 30),
+                            help='保留天数')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='每次删除的行数')
+        parser.add_argument('--sleep', type=float, default=0.0, help='每块之间的休眠秒数')
+        parser.add_argument('--dry-run', action='store_true', help='只统计待删除行数，不删除')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        self.stdout.write(f'🧹 清理 {cutoff:%Y-%m-%d %H:%M:%S} 之前删除的记录')
+        # 先删对话再删主题：中途中断也不会留下无主题的对话
+        for model in (Conversation, Theme):
+            total = self.purge(model, cutoff, options['chunk_size'], options['sleep'], options['dry_run'])
+            action = '待删除' if options['dry_run'] else '已删除'
+            self.stdout.write(f'✅ {model.__name__}: {action} {total} 行')
+
+    def purge(self, model, cutoff, chunk_size, sleep, dry_run):
+        expired = model.objects.filter(is_deleted=1, delete_time__lt=cutoff)
+        if dry_run:
+            return expired.count()
+
+        total, last_id = 0, 0
+        while True:
+            # 按主键向后推进：每块只扫描上一块之后的行，总扫描量与表大小线性相关
+            ids = list(expired.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size])
+            if not ids:
+                return total
+            deleted, _ = model.objects.filter(id__in=ids).delete()
+            total += deleted
+            last_id = ids[-1]
+            if sleep:
+                time.sleep(sleep)
@@ -0,0 +1,182 @@
+"""
+长期记忆模块：基于 Theme 表持久化的滚动摘要
+
+功能说明：
+- 短期记忆：最近 SHORT_TERM_SIZE 条对话原样进入模型上下文
+- 长期记忆：更早的对话压缩为一段摘要，保存在 Theme.summary 中
+- 增量折叠：Theme.summary_last_id 记录摘要已覆盖到的对话 id，
+  每轮只把新移出短期窗口的对话折叠进旧摘要，无需从头重新摘要
+- 后台执行：摘要在助手回复保存后由后台线程池预先计算，
+  请求路径只读取最新已就绪的摘要，不再等待摘要模型调用
+- 有界加载：请求路径只倒序取最近的若干条对话（values() 字典，不构造模型对象），
+  更早的上下文由摘要提供，每轮数据库开销与对话长度无关
+"""
+
+from .background import KeyedRunner
+from .models import Conversation, Theme
+from .writebehind import flush_conversations
+from .captions import with_caption
+
+# 短期记忆窗口大小：最近 N 条对话原样保留
+SHORT_TERM_SIZE = 10
+# 后台摘要落后时，最多原样保留的未摘要对话条数（防止上下文无限增长）
+MAX_UNSUMMARIZED = 30
+
+# 后台摘要任务：摘要调用不阻塞请求，同一主题同时只有一个任务
+_summary_runner = KeyedRunner("summary", "摘要")
+
+
+# =================================================
+# 将新对话折叠进已有摘要
+# =================================================
+def fold_summary(qwen, previous_summary, items):
+    """
+    调用 qwen-flash 把新对话合并进旧摘要
+
+    Args:
+        qwen (QwenLLM): 模型调用实例
+        previous_summary (str): 已有摘要（可为空）
+        items (List[dict]): 新移出短期窗口的对话记录 {id, role, content, image_caption}
+    Returns:
+        str | None: 新摘要；调用失败时返回 None
+    """
+    # 拼接新增对话文本（按角色+内容格式）
+    history_text = "\n".join([
+        f"[{item['role'].upper()}]: {with_caption(item['content'], item['image_caption'])}"
+        for item in items
+    ])
+
+    # 摘要提示词：已有摘要 + 新增对话 → 合并后的新摘要
+    summary_prompt = (f'''
+    你是一个对话摘要助手。请将【已有摘要】与【新增对话】合并，压缩成一段不超过100字的简洁摘要，保留核心信息和用户意图。\n\n
+    已有摘要：
+    {previous_summary or "无"}
+
+    新增对话：
+    {history_text}
+    ''')
+
+    return qwen.inference_text(
+        messages=[{"role": "user", "content": summary_prompt}],
+        model="qwen-flash",
+    )
+
+
+# =================================================
+# 增量更新主题的滚动摘要
+# =================================================
+def update_theme_summary(qwen, theme, aged_out):
+    """
+    只折叠 id 大于 summary_last_id 的对话，并持久化新摘要
+
+    - 比较并写入：只有数据库中的 summary_last_id 仍是读取时的值才写入，
+      期间已被其他进程推进时放弃本次结果，不会用旧摘要覆盖更新的摘要
+
+    Args:
+        qwen (QwenLLM): 模型调用实例
+        theme (dict): 当前对话主题 {id, summary, summary_last_id}
+        aged_out (List[dict]): 已移出短期窗口的对话记录（按 id 升序）
+    Returns:
+        bool: 是否写入了新摘要
+    """
+    new_items = [item for item in aged_out if item['id'] > theme['summary_last_id']]
+    if not new_items:
+        return False
+
+    summary = fold_summary(qwen, theme['summary'], new_items)
+    if summary is None:
+        # 失败时不推进 summary_last_id，下一轮会重试
+        return False
+
+    updated = Theme.objects.filter(
+        id=theme['id'],
+        summary_last_id=theme['summary_last_id'],
+    ).update(
+        summary=summary,
+        summary_last_id=new_items[-1]['id'],
+    )
+    if not updated:
+        print(f"主题 {theme['id']} 的摘要已被更新，跳过本次结果")
+    return bool(updated)
+
+
+# =================================================
+# 请求路径：读取已就绪的摘要 + 最近的对话窗口
+# =================================================
+def load_recent_history(theme, user_id, theme_id):
+    """
+    只从数据库读取需要原样放入上下文的对话
+
+    - 最近 SHORT_TERM_SIZE 条始终原样保留
+    - 后台摘要尚未覆盖到的较早对话也原样保留（最多 MAX_UNSUMMARIZED 条），
+      避免摘要落后时丢失上下文；只有最近窗口全部未被摘要覆盖时才补取
+    - 倒序 + LIMIT 查询，最多读取 MAX_UNSUMMARIZED 行
+
+    Args:
+        theme (Theme | None): 当前对话主题
+        user_id (int): 用户 id
+        theme_id (int): 对话主题 id
+    Returns:
+        Tuple[str, List[dict]]: (长期记忆摘要, 短期记忆列表[{id, role, content, image_caption}]，按 id 升序)
+    """
+    recent_qs = Conversation.objects.filter(
+        user_id=user_id,
+        theme_id=theme_id,
+        is_deleted=0,
+    ).order_by('-id').values('id', 'role', 'content', 'image_caption')  # 从新到旧
+
+    recent = list(recent_qs[:SHORT_TERM_SIZE])
+    if theme is None:
+        recent.reverse()
+        return "", recent
+
+    if len(recent) == SHORT_TERM_SIZE and recent[-1]['id'] > theme.summary_last_id:
+        # 摘要落后：最近窗口之前仍有未摘要的对话，补取到 MAX_UNSUMMARIZED 条为止
+        recent += list(recent_qs.filter(
+            id__gt=theme.summary_last_id,
+            id__lt=recent[-1]['id'],
+        )[:MAX_UNSUMMARIZED - SHORT_TERM_SIZE])
+    recent.reverse()  # 从旧到新
+    return theme.summary, recent
+
+
+# =================================================
+# 后台任务：刷新主题摘要
+# =================================================
+def refresh_theme_summary(qwen, theme_id, user_id):
+    """
+    从数据库读取摘要之后的新对话，把已移出短期窗口的部分折叠进摘要
+
+    Args:
+        qwen (QwenLLM): 模型调用实例
+        theme_id (int): 对话主题 id
+        user_id (int): 用户 id
+    """
+    theme = Theme.objects.filter(
+        id=theme_id, user_id=user_id, is_deleted=0,
+    ).values('id', 'summary', 'summary_last_id').first()
+    if theme is None:
+        return
+    flush_conversations(theme_id)  # 刚保存的回复可能仍在写入缓冲队列中
+    # 只取摘要尚未覆盖的对话，去掉最近 SHORT_TERM_SIZE 条即为需要折叠的部分
+    unsummarized = list(Conversation.objects.filter(
+        user_id=user_id,
+        theme_id=theme_id,
+        is_deleted=0,
+        id__gt=theme['summary_last_id'],
+    ).order_by('id').values('id', 'role', 'content', 'image_caption'))
+    aged_out = unsummarized[:-SHORT_TERM_SIZE]
+    if aged_out:
+        update_theme_summary(qwen, theme, aged_out)
+
+
+def schedule_summary(qwen, theme_id, user_id):
+    """
+    提交后台摘要任务（同一主题同时只有一个任务在执行）
+
+    Args:
+        qwen (QwenLLM): 模型调用实例
+        theme_id (int): 对话主题 id
+        user_id (int): 用户 id
+    """
+    _summary_runner.schedule(theme_id, refresh_theme_summary, qwen, theme_id, user_id)
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-18 00:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diet_asst', '0004_delete_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='theme',
+            name='summary',
+            field=models.TextField(blank=True, default='', verbose_name='历史对话摘要'),
+        ),
+        migrations.AddField(
+            model_name='theme',
+            name='summary_last_id',
+            field=models.BigIntegerField(default=0, verbose_name='摘要截止对话id'),
+        ),
+    ]
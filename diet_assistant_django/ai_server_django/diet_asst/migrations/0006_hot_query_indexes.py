@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-18 01:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diet_asst', '0005_theme_summary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['user_id', 'theme_id', 'is_deleted', 'id'], name='conv_user_theme_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='theme',
+            index=models.Index(fields=['user_id', 'is_deleted', '-create_time'], name='theme_user_time_idx'),
+        ),
+    ]
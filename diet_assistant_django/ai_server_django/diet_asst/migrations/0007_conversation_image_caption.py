@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 01:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diet_asst', '0006_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='image_caption',
+            field=models.TextField(blank=True, default='', verbose_name='图片描述'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-18 01:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diet_asst', '0007_conversation_image_caption'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='theme',
+            name='theme_user_time_idx',
+        ),
+        migrations.AddIndex(
+            model_name='theme',
+            index=models.Index(fields=['user_id', 'is_deleted', '-create_time', '-id'], name='theme_user_time_id_idx'),
+        ),
+    ]
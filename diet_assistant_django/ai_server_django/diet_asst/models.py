@@ -43,6 +43,23 @@ class Theme(models.Model):
         null=True,
         verbose_name='删除时间',
     )
+    # 长期记忆：滚动摘要字段（增量折叠已移出短期窗口的对话）
+    summary = models.TextField(
+        blank=True,
+        default='',
+        verbose_name='历史对话摘要',
+    )
+    # 摘要已覆盖到的最后一条对话 id（Conversation.id）
+    summary_last_id = models.BigIntegerField(
+        default=0,
+        verbose_name='摘要截止对话id',
+    )
+
+    class Meta:
+        indexes = [
+            # 历史主题列表：按用户查询未删除主题，按创建时间倒序（创建时间相同时按 id 倒序，与分页游标一致）
+            models.Index(fields=['user_id', 'is_deleted', '-create_time', '-id'], name='theme_user_time_id_idx'),
+        ]
 
 
 '''
@@ -100,4 +117,16 @@ class Conversation(models.Model):
         null=True,
         verbose_name='图片URL',
     )
+    # 图片描述：由视觉模型为上传图片生成一次，后续轮次以文字形式带入上下文
+    image_caption = models.TextField(
+        blank=True,
+        default='',
+        verbose_name='图片描述',
+    )
+
+    class Meta:
+        indexes = [
+            # 每轮对话 / 历史详情：按用户+主题查询未删除对话，按 id 排序
+            models.Index(fields=['user_id', 'theme_id', 'is_deleted', 'id'], name='conv_user_theme_idx'),
+        ]
 
@@ -0,0 +1,118 @@
+"""
+分页模块：history / continue_history 接口的游标（keyset）分页与流式导出
+
+功能说明：
+- 游标分页：按 (create_time, id) / id 定位下一页，不使用 OFFSET，翻到多深都只扫描一页数据
+- 游标为 base64 编码的 JSON 数组，对客户端不透明，原样回传即可
+- 未传 limit 时保持原有行为（一次返回全部数据），兼容旧版客户端
+- 流式导出：按 keyset 逐页查询（每页 STREAM_CHUNK_SIZE 行）并分段输出 JSON，内存中只保留一页数据
+  （不使用 QuerySet.iterator()：MySQLdb 驱动会先把整个结果集读入内存，并不能真正流式读取）
+"""
+
+import base64
+import json
+
+# 单页最大条数
+MAX_PAGE_SIZE = 100
+# 流式导出时每次从数据库读取的行数
+STREAM_CHUNK_SIZE = 500
+
+
+# =================================================
+# 参数解析
+# =================================================
+def parse_limit(value):
+    """
+    解析 limit 参数
+
+    Returns:
+        int | None: 每页条数（最大 MAX_PAGE_SIZE）；未传时返回 None（不分页）
+    Raises:
+        ValueError: 参数不是正整数
+    """
+    if value in (None, ''):
+        return None
+    limit = int(value)
+    if limit <= 0:
+        raise ValueError('limit 必须为正整数')
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def encode_cursor(*values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """
+    解析游标
+
+    Returns:
+        list | None: 游标中的字段值；未传时返回 None
+    Raises:
+        ValueError: 游标格式错误
+    """
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception as e:
+        raise ValueError('cursor 格式错误') from e
+    if not isinstance(values, list):
+        raise ValueError('cursor 格式错误')
+    return values
+
+
+# =================================================
+# 取一页数据：多取一条用于判断是否还有下一页
+# =================================================
+def fetch_page(queryset, limit):
+    """
+    Returns:
+        Tuple[list, bool]: (本页数据, 是否还有下一页)
+    """
+    rows = list(queryset[:limit + 1])
+    return rows[:limit], len(rows) > limit
+
+
+# =================================================
+# 按 keyset 逐页读取全部数据（流式导出、离线统计使用）
+# =================================================
+def iter_pages(queryset, after, size=STREAM_CHUNK_SIZE):
+    """
+    Args:
+        queryset (QuerySet): 已排序的查询（values() 行）
+        after (Callable[[dict], Q]): 上一页最后一行 → 下一页的过滤条件（与排序方向一致）
+        size (int): 每页行数
+    Yields:
+        dict: 数据行，每次查询只读取一页
+    """
+    page = queryset
+    while True:
+        rows, has_more = fetch_page(page, size)
+        yield from rows
+        if not has_more:
+            return
+        page = queryset.filter(after(rows[-1]))
+
+
+# =================================================
+# 流式 JSON：{...固定字段, "<key>": [逐条输出]}
+# =================================================
+def stream_json(data, key, rows, format_row):
+    """
+    分段生成 JSON 文本，格式与 JsonResponse(data | {key: [...]}) 一致
+
+    Args:
+        data (dict): 固定字段（status、message 等）
+        key (str): 列表字段名
+        rows (Iterable[dict]): 数据行（建议使用 iter_pages() 逐页读取）
+        format_row (Callable[[dict], dict]): 数据行 → 输出条目
+    """
+    head = json.dumps(data, ensure_ascii=False)[:-1]  # 去掉末尾的 }
+    yield f'{head}, "{key}": ['
+    first = True
+    for row in rows:
+        item = json.dumps(format_row(row), ensure_ascii=False)
+        yield item if first else ',' + item
+        first = False
+    yield ']}'
@@ -0,0 +1,202 @@
+"""
+模型路由模块：按提问复杂度在 qwen-flash 与 qwen-plus 之间选择文本模型
+
+功能说明：
+- 低成本分类：只用提问文本的启发式规则 + RAG 重排序得分（检索阶段已计算），不额外调用模型
+  * 深度思考、超长提问、包含复杂意图关键词（食谱/计划/疾病等）、一次问多个问题 → 复杂
+  * 简单查询关键词（热量、蛋白质含量等）或知识库命中可信（最高重排序得分达到阈值） → 简单
+  * 其余按 policy['default_route'] 处理
+- 路由策略可配置：settings.MODEL_ROUTER（关闭时所有文本提问使用 complex_model）
+- 分路由统计：请求数、首字延迟、总延迟 p50/p95、输入/输出 token 数（流式响应末尾的 usage），
+  route_stats() 返回统计结果，每 log_every 次请求打印一次
+- 离线评估：python manage.py evaluate_router（对已记录的用户提问重新分类，可选回放对比两个模型）
+"""
+
+import re
+import threading
+import time
+from collections import deque
+from django.conf import settings
+from utils.LatencyStats import percentiles
+
+# 默认路由策略（settings.MODEL_ROUTER 中的同名配置会覆盖）
+DEFAULT_POLICY = {
+    'enabled': True,  # 是否开启路由
+    'simple_model': 'qwen-flash',  # 简单提问使用的模型
+    'complex_model': 'qwen-plus',  # 复杂提问使用的模型
+    'default_route': 'complex',  # 规则无法判断时的路由
+    'max_simple_chars': 40,  # 超过该字数的提问视为复杂
+    'min_rag_score': 2.0,  # 知识库命中可信的最低重排序得分（BGE 原始得分）
+    'complex_keywords': [
+        '计划', '食谱', '菜谱', '方案', '一周', '每天怎么吃', '搭配', '安排',
+        '减脂', '增肌', '备孕', '孕妇', '哺乳', '糖尿病', '高血压', '痛风', '肾病', '过敏',
+        '为什么', '原理', '分析', '对比', '比较', '区别', '评估',
+    ],
+    'simple_keywords': [
+        '热量', '卡路里', '大卡', '千卡', '蛋白质含量', '脂肪含量', '碳水含量', '含糖量', 'GI', '升糖指数',
+        '能不能吃', '可以吃吗', '能吃吗', '是什么',
+    ],
+    'log_every': 200,  # 每 N 次请求打印一次分路由统计（0 表示不打印）
+}
+
+# 一次提出多个问题（两个及以上问号）视为复杂
+_QUESTION_MARKS = re.compile(r'[?？]')
+
+
+def get_policy(overrides=None):
+    """合并默认策略、settings.MODEL_ROUTER 与临时覆盖项（离线评估时使用）"""
+    policy = dict(DEFAULT_POLICY)
+    policy.update(getattr(settings, 'MODEL_ROUTER', {}))
+    if overrides:
+        policy.update(overrides)
+    return policy
+
+
+# =================================================
+# 提问分类
+# =================================================
+def classify_query(query, rag_scores=None, enable_thinking=False, policy=None):
+    """
+    Args:
+        query (str): 用户提问
+        rag_scores (List[float] | None): 检索结果的重排序得分（降序，未重排序时为空）
+        enable_thinking (bool): 是否开启深度思考
+        policy (dict | None): 路由策略，默认使用 get_policy()
+    Returns:
+        Tuple[str, str]: (路由 simple/complex, 判定原因)
+    """
+    policy = policy or get_policy()
+    text = query.strip()
+
+    if enable_thinking:
+        return 'complex', 'deepthink'
+    if len(text) > policy['max_simple_chars']:
+        return 'complex', 'length'
+    if any(keyword in text for keyword in policy['complex_keywords']):
+        return 'complex', 'complex_keyword'
+    if len(_QUESTION_MARKS.findall(text)) >= 2:
+        return 'complex', 'multi_question'
+    if any(keyword in text for keyword in policy['simple_keywords']):
+        return 'simple', 'simple_keyword'
+    if rag_scores and max(rag_scores) >= policy['min_rag_score']:
+        return 'simple', 'rag_confident'
+    return policy['default_route'], 'default'
+
+
+def route_query(query, rag_scores=None, enable_thinking=False, policy=None):
+    """
+    选择回答文本提问的模型
+
+    Returns:
+        dict: {"route": simple/complex, "model": 模型名, "reason": 判定原因}
+    """
+    policy = policy or get_policy()
+    if not policy['enabled']:
+        return {"route": "complex", "model": policy['complex_model'], "reason": "disabled"}
+    route, reason = classify_query(query, rag_scores, enable_thinking, policy)
+    model = policy['simple_model'] if route == 'simple' else policy['complex_model']
+    return {"route": route, "model": model, "reason": reason}
+
+
+# =================================================
+# RouteStats：分路由延迟与 token 统计
+# =================================================
+class RouteStats:
+    def __init__(self, log_every=200, window=1000):
+        self.log_every = log_every
+        self.window = window  # 计算延迟分位数时保留的最近样本数
+        self._routes = {}
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def start(self, route, model):
+        """开始统计一次模型调用，返回该请求的计量对象"""
+        return RouteMeter(self, route, model)
+
+    def record(self, route, model, first_token, latency, prompt_tokens, completion_tokens, completed):
+        with self._lock:
+            stats = self._routes.get(route)
+            if stats is None:
+                stats = self._routes[route] = {
+                    "requests": 0,
+                    "errors": 0,
+                    "models": {},
+                    "prompt_tokens": 0,
+                    "completion_tokens": 0,
+                    "first_token": deque(maxlen=self.window),
+                    "latency": deque(maxlen=self.window),
+                }
+            stats["requests"] += 1
+            stats["models"][model] = stats["models"].get(model, 0) + 1
+            if not completed:
+                stats["errors"] += 1
+            stats["prompt_tokens"] += prompt_tokens
+            stats["completion_tokens"] += completion_tokens
+            if first_token is not None:
+                stats["first_token"].append(first_token)
+            stats["latency"].append(latency)
+            self._total += 1
+            should_log = self.log_every and self._total % self.log_every == 0
+        if should_log:
+            print(f"🧭 模型路由统计: {self.stats()}")
+
+    def stats(self):
+        with self._lock:
+            return {route: self._summarize(stats) for route, stats in self._routes.items()}
+
+    @staticmethod
+    def _summarize(stats):
+        requests = stats["requests"]
+        return {
+            "requests": requests,
+            "errors": stats["errors"],
+            "models": dict(stats["models"]),
+            "prompt_tokens": stats["prompt_tokens"],
+            "completion_tokens": stats["completion_tokens"],
+            "avg_completion_tokens": round(stats["completion_tokens"] / requests, 1) if requests else 0.0,
+            "first_token_ms": percentiles(stats["first_token"]),
+            "latency_ms": percentiles(stats["latency"]),
+        }
+
+
+# =================================================
+# RouteMeter：单次流式调用的计量
+# =================================================
+class RouteMeter:
+    def __init__(self, route_stats, route, model):
+        self.route_stats = route_stats
+        self.route = route
+        self.model = model
+        self.start_time = time.monotonic()
+        self.first_token = None
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._finished = False
+
+    def observe(self, chunk):
+        """处理流式响应的一个数据块：记录首字延迟，读取末尾数据块中的 usage"""
+        if self.first_token is None and chunk.choices:
+            delta = chunk.choices[0].delta
+            if delta and delta.content:
+                self.first_token = time.monotonic() - self.start_time
+        usage = getattr(chunk, "usage", None)
+        if usage:
+            self.prompt_tokens = usage.prompt_tokens or 0
+            self.completion_tokens = usage.completion_tokens or 0
+
+    def finish(self, completed):
+        if self._finished:
+            return
+        self._finished = True
+        self.route_stats.record(
+            self.route,
+            self.model,
+            self.first_token,
+            time.monotonic() - self.start_time,
+            self.prompt_tokens,
+            self.completion_tokens,
+            completed,
+        )
+
+
+route_stats = RouteStats(log_every=get_policy()['log_every'])
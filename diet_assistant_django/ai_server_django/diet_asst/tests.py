@@ -1,3 +1,98 @@
+from unittest import mock
+
 from django.test import TestCase
+from django.utils import timezone
+
+from . import writebehind
+from .memory import load_recent_history, update_theme_summary
+from .models import Conversation, Theme
+from .writebehind import ConversationWriteBuffer, flush_conversations
+
+
+def conversation_fields(theme_id, content, role='user'):
+    return {
+        "theme_id": theme_id,
+        "user_id": 1,
+        "role": role,
+        "content": content,
+        "create_time": timezone.now(),
+        "update_time": timezone.now(),
+    }
+
+
+# =================================================
+# 对话写入缓冲：写入失败 / 读己之写
+# =================================================
+class ConversationWriteBufferTests(TestCase):
+    def setUp(self):
+        # 刷新间隔足够长：测试期间后台线程不会自行刷新
+        self.buffer = ConversationWriteBuffer(flush_interval=3600, max_batch=200)
+        patcher = mock.patch.object(writebehind, 'conversation_buffer', self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.buffer.close)
+
+    def test_failed_row_is_dropped_without_blocking_others(self):
+        self.buffer.save(**conversation_fields(1, "第一条"))
+        self.buffer.save(**conversation_fields(1, "无法写入", role=None))  # role 不允许为空
+        self.buffer.save(**conversation_fields(1, "第三条"))
+
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(
+            list(Conversation.objects.order_by('id').values_list('content', flat=True)),
+            ["第一条", "第三条"],
+        )
+        # 失败的记录不放回队列，后续请求的刷新不再受影响
+        self.assertFalse(self.buffer.has_pending([1]))
+        self.buffer.save(**conversation_fields(1, "第四条"))
+        flush_conversations(1)
+        self.assertEqual(Conversation.objects.count(), 3)
+
+    def test_flush_does_not_raise_into_requests(self):
+        self.buffer.save(**conversation_fields(1, "无法写入", role=None))
+        flush_conversations(1)
+        self.assertEqual(Conversation.objects.count(), 0)
+
+    def test_read_after_write(self):
+        self.buffer.save(**conversation_fields(1, "苹果的热量是多少"))
+        self.buffer.save(**conversation_fields(1, "约52千卡/100克", role='assistant'))
+
+        flush_conversations(1)
+        _, recent = load_recent_history(None, 1, 1)
+        self.assertEqual([item['content'] for item in recent], ["苹果的热量是多少", "约52千卡/100克"])
+
+    def test_flush_skipped_for_other_themes(self):
+        self.buffer.save(**conversation_fields(2, "其他主题的提问"))
+
+        flush_conversations(1)
+        self.assertFalse(Conversation.objects.exists())
+        self.assertTrue(self.buffer.has_pending([2]))
+
+        flush_conversations(2)
+        self.assertTrue(Conversation.objects.filter(theme_id=2).exists())
+
+
+# =================================================
+# 滚动摘要：比较并写入
+# =================================================
+class ThemeSummaryTests(TestCase):
+    def setUp(self):
+        self.qwen = mock.Mock()
+        self.qwen.inference_text.return_value = "新摘要"
+        self.theme = Theme.objects.create(user_id=1)
+        self.items = [{"id": 5, "role": "user", "content": "早餐吃什么", "image_caption": ""}]
+
+    def test_summary_written_when_unchanged(self):
+        theme = {"id": self.theme.id, "summary": "", "summary_last_id": 0}
+        self.assertTrue(update_theme_summary(self.qwen, theme, self.items))
+        self.theme.refresh_from_db()
+        self.assertEqual((self.theme.summary, self.theme.summary_last_id), ("新摘要", 5))
+
+    def test_stale_summary_is_skipped(self):
+        theme = {"id": self.theme.id, "summary": "", "summary_last_id": 0}
+        # 模型调用期间其他进程已推进摘要
+        Theme.objects.filter(id=self.theme.id).update(summary="更新的摘要", summary_last_id=8)
 
-# Create your tests here.
+        self.assertFalse(update_theme_summary(self.qwen, theme, self.items))
+        self.theme.refresh_from_db()
+        self.assertEqual((self.theme.summary, self.theme.summary_last_id), ("更新的摘要", 8))
@@ -0,0 +1,187 @@
+"""
+文件上传模块：流式写盘 + 内容哈希去重（内容寻址存储）
+
+功能说明：
+- HashingUploadHandler：Django 上传处理器，multipart 数据块到达时直接写入临时文件并同步计算 SHA-256，
+  不在内存中缓冲整个文件；临时文件写在不对外提供访问的目录（settings.UPLOAD_TEMP_DIR），校验通过后才移入存储目录
+- 大小 / 类型限制在缓冲之前检查：
+  * 请求头 CONTENT_LENGTH 超限时视图直接拒绝，不读取请求体
+  * 文件头（magic number）不是允许的图片格式、或累计大小超限时立即停止接收
+- 内容寻址：文件保存为 <sha256><扩展名>，相同内容只保存一份；重复上传直接返回已有文件地址
+"""
+
+import hashlib
+import os
+import re
+import shutil
+import struct
+import uuid
+from pathlib import Path
+
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+
+# 允许上传的图片格式：文件头 -> (MIME 类型, 扩展名)
+IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", ("image/jpeg", ".jpg")),
+    (b"\x89PNG\r\n\x1a\n", ("image/png", ".png")),
+    (b"GIF87a", ("image/gif", ".gif")),
+    (b"GIF89a", ("image/gif", ".gif")),
+]
+# BMP 信息头（DIB header）的合法长度：BITMAPCOREHEADER / BITMAPINFOHEADER / V2~V5
+_BMP_DIB_SIZES = {12, 40, 52, 56, 64, 108, 124}
+# 嗅探文件类型时读取的文件头长度
+SNIFF_SIZE = 32
+# 内容寻址文件名：64 位十六进制 SHA-256 + 扩展名
+_DIGEST_NAME = re.compile(r"^([0-9a-f]{64})\.[a-z]+$")
+
+
+def sniff_image_type(head):
+    """根据文件头判断图片格式，返回 (MIME 类型, 扩展名)，不支持时返回 None"""
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp", ".webp"
+    if _is_bmp(head):
+        return "image/bmp", ".bmp"
+    for signature, image_type in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return image_type
+    return None
+
+
+def _is_bmp(head):
+    """BMP 只有 2 字节签名 "BM"，需同时校验文件头字段：保留字段为 0、信息头长度合法、像素数据偏移在头部之后"""
+    if len(head) < 18 or not head.startswith(b"BM"):
+        return False
+    file_size, reserved, pixel_offset, dib_size = struct.unpack("<IIII", head[2:18])
+    return (
+        reserved == 0
+        and dib_size in _BMP_DIB_SIZES
+        and 14 + dib_size <= pixel_offset
+        and (file_size == 0 or pixel_offset < file_size)  # 部分编码器把文件大小写为 0
+    )
+
+
+def digest_from_url(url):
+    """从内容寻址的文件地址中取出 SHA-256（旧的时间戳文件名返回 None）"""
+    match = _DIGEST_NAME.match(os.path.basename(url or ""))
+    return match.group(1) if match else None
+
+
+# =================================================
+# 上传结果：文件已保存在内容寻址存储中
+# =================================================
+class StoredUpload(UploadedFile):
+    def __init__(self, name, content_type, size, digest, path, deduplicated):
+        self.path = path
+        self._file = None
+        super().__init__(file=None, name=name, content_type=content_type, size=size)
+        self.digest = digest
+        self.deduplicated = deduplicated  # True 表示命中已有文件（本次未新增磁盘占用）
+
+    # 已保存的文件按需打开：只用到 path 时不占用文件句柄，read() / chunks() 时才打开
+    @property
+    def file(self):
+        if self._file is None:
+            self._file = open(self.path, "rb")
+        return self._file
+
+    @file.setter
+    def file(self, value):
+        self._file = value
+
+    @property
+    def closed(self):
+        return self._file is None or self._file.closed
+
+    def open(self, mode="rb"):
+        if self.closed:
+            self._file = open(self.path, mode)
+        else:
+            self._file.seek(0)
+        return self
+
+    def close(self):
+        # 请求结束时 Django 会关闭所有上传文件：未打开过则无需处理
+        if self._file is not None:
+            self._file.close()
+
+
+# =================================================
+# HashingUploadHandler：边接收边写盘、边计算哈希
+# =================================================
+class HashingUploadHandler(FileUploadHandler):
+    def __init__(self, request, store_dir, tmp_dir, max_size):
+        """
+        Args:
+            request (HttpRequest): 当前请求
+            store_dir (str | Path): 内容寻址存储目录
+            tmp_dir (str | Path): 接收过程中的临时文件目录（不能在静态文件目录下，建议与存储目录在同一文件系统）
+            max_size (int): 单个文件最大字节数
+        """
+        super().__init__(request)
+        self.store_dir = Path(store_dir)
+        self.tmp_dir = Path(tmp_dir)
+        self.max_size = max_size
+        self.error = None  # 拒绝原因（视图据此返回错误信息）
+        self._tmp = None
+        self._tmp_path = None
+        self._sha256 = None
+        self._image_type = None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        # 文件声明的长度已超限：不再接收
+        if self.content_length is not None and self.content_length > self.max_size:
+            self._reject("文件过大")
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        self._tmp_path = self.tmp_dir / f".upload-{uuid.uuid4().hex}.tmp"
+        self._tmp = open(self._tmp_path, "wb")
+        self._sha256 = hashlib.sha256()
+        self._image_type = None
+
+    def receive_data_chunk(self, raw_data, start):
+        if start == 0:
+            # 首个数据块：按文件头校验格式（不信任客户端声明的类型和扩展名）
+            self._image_type = sniff_image_type(raw_data[:SNIFF_SIZE])
+            if self._image_type is None:
+                self._reject("不支持的文件类型")
+        if start + len(raw_data) > self.max_size:
+            self._reject("文件过大")
+        self._tmp.write(raw_data)
+        self._sha256.update(raw_data)
+        return None  # 数据已处理，不再传给其他处理器
+
+    def file_complete(self, file_size):
+        self._tmp.close()
+        if self._image_type is None:  # 空文件
+            self._discard()
+            self.error = "文件为空"
+            return None
+
+        digest = self._sha256.hexdigest()
+        content_type, ext = self._image_type
+        path = self.store_dir / f"{digest}{ext}"
+        deduplicated = path.exists()
+        if deduplicated:
+            self._discard()  # 相同内容已存在：丢弃本次写入
+        else:
+            # 同一文件系统内为原子重命名；跨文件系统时退化为复制后删除
+            shutil.move(self._tmp_path, path)
+        self._tmp = self._tmp_path = None
+        return StoredUpload(path.name, content_type, file_size, digest, path, deduplicated)
+
+    def upload_complete(self):
+        # 上传中断 / 被拒绝：清理临时文件
+        if self._tmp is not None:
+            self._tmp.close()
+            self._discard()
+
+    def _reject(self, reason):
+        self.error = reason
+        raise StopUpload(connection_reset=False)
+
+    def _discard(self):
+        if self._tmp_path is not None and self._tmp_path.exists():
+            self._tmp_path.unlink()
+        self._tmp = self._tmp_path = None
@@ -6,6 +6,8 @@ from . import views
 urlpatterns = [
     # 助手聊天接口
     path("ai/", views.assistant, name="assistant"),
+    # 异步助手聊天接口（需以 ASGI 方式部署，如 uvicorn ai_server_django.asgi:application）
+    path("ai_async/", views.assistant_async, name="assistant_async"),
     # 上传文件接口
     path("upload/", views.uploadfile, name="uploadfile"),
     # 对话历史记录接口
@@ -14,4 +16,6 @@ urlpatterns = [
     path("continue/", views.continue_history, name="continue"),
     # 删除某条对话记录接口
     path("delTheme/", views.del_theme, name="delTheme"),
+    # 批量删除对话记录接口
+    path("delThemes/", views.del_themes, name="delThemes"),
 ]
@@ -2,41 +2,75 @@ from django.http import JsonResponse, StreamingHttpResponse
 from django.core.files.storage import FileSystemStorage
 from django.conf import settings
 from django.utils import timezone
-import base64
+from django.utils.dateparse import parse_datetime
+from django.db.models import Q
+from django.db import transaction
 import os
+import threading
 import time
-from utils.QwenLLM import QwenLLM
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from asgiref.sync import sync_to_async
+from utils.QwenLLM import QwenLLM, AsyncQwenLLM
 from .models import Conversation,Theme
+from .memory import load_recent_history, schedule_summary
+from .writebehind import save_conversation, flush_conversations
+from .uploads import HashingUploadHandler, digest_from_url
+from .captions import schedule_caption, with_caption
+from .routing import route_query, route_stats
+from .pagination import parse_limit, encode_cursor, decode_cursor, fetch_page, iter_pages, stream_json
 from utils.RAGSystem import RAGSystem
+from utils.SemanticCache import SemanticCache
+from utils.ImagePipeline import ImagePipeline
 
 # 初始化 QwenLLM类
 qwen = QwenLLM()
+# 初始化 AsyncQwenLLM类（异步聊天接口使用，共享连接池）
+async_qwen = AsyncQwenLLM()
 # 初始化 RAGSystem类
 rag = RAGSystem()
+# 初始化 SemanticCache类（语义回答缓存，需在 settings.SEMANTIC_CACHE 中开启）
+SEMANTIC_CACHE = getattr(settings, 'SEMANTIC_CACHE', {})
+semantic_cache = SemanticCache(
+    threshold=SEMANTIC_CACHE.get('threshold', 0.95),
+    ttl=SEMANTIC_CACHE.get('ttl', 3600),
+    max_entries=SEMANTIC_CACHE.get('max_entries', 2000),
+) if SEMANTIC_CACHE.get('enabled') else None
+
+# 初始化 ImagePipeline类（上传图片的压缩版本保存在 static/uploads/compact）
+IMAGE_PIPELINE = getattr(settings, 'IMAGE_PIPELINE', {})
+image_pipeline = ImagePipeline(
+    variant_dir=settings.BASE_DIR / "static" / "uploads" / "compact",
+    max_side=IMAGE_PIPELINE.get('max_side', 1024),
+    quality=IMAGE_PIPELINE.get('quality', 85),
+    cache_size=IMAGE_PIPELINE.get('cache_size', 128),
+)
+# 图片预处理线程池：解码/缩放占用 CPU，与聊天前置阶段的线程池分开，大图上传不会拖慢主题命名和 RAG 检索
+image_executor = ThreadPoolExecutor(
+    max_workers=IMAGE_PIPELINE.get('workers', 2),
+    thread_name_prefix="image-prepare",
+)
+
+# 上传文件大小限制（字节）
+UPLOAD_MAX_SIZE = getattr(settings, 'UPLOAD_MAX_SIZE', 10 * 1024 * 1024)
+# 上传临时文件目录（不在 static 下，接收中的文件不会被访问到）
+UPLOAD_TEMP_DIR = getattr(settings, 'UPLOAD_TEMP_DIR', settings.BASE_DIR / "upload_tmp")
+
+# 前置阶段线程池：主题命名、RAG检索互不依赖，并发执行
+# 每个聊天请求最多占用 2 个线程，线程数应按服务并发数配置（settings.CHAT_STAGE_WORKERS）
+STAGE_WORKERS = getattr(settings, 'CHAT_STAGE_WORKERS', 32)
+stage_executor = ThreadPoolExecutor(max_workers=STAGE_WORKERS, thread_name_prefix="chat-stage")
+# 已提交且尚未结束的前置阶段任务数（超过线程数时新任务需要排队）
+_stage_pending = 0
+_stage_lock = threading.Lock()
+# 前置阶段超时（秒）：超时后降级处理，不阻塞回答
+STAGE_TIMEOUTS = getattr(settings, 'CHAT_STAGE_TIMEOUTS', {'theme_name': 3, 'rag': 5})
+# 主题命名失败时使用的默认主题名（与 Theme.theme_name 默认值一致）
+DEFAULT_THEME_NAME = '健康饮食小助手对话'
 
 # ===================== 工具函数 =====================
-# 图片编码函数：将本地文件转为base64编码的字符串
-def encode_image(image_path):
-    with open(image_path, 'rb') as f:
-        return base64.b64encode(f.read()).decode('utf-8')
-
-
-# ===================== 核心业务接口 =====================
-# 助手聊天接口：处理用户对话请求
-def assistant(request):
-    # 接受客户端的 POST请求，获取请求数据
-    query = request.POST.get('query', '用户未输入任何内容')
-    user_id = int(request.POST.get('user_id', 1))
-
-    # --------------------------------------------------
-    # 对话主题处理：无主题时自动生成并创建主题，有主题时复用
-    # --------------------------------------------------
-    # 接收前端传入的 对话主题 id
-    theme_id = int(request.POST.get('theme_id', 0))
-
-    if theme_id == 0:
-        # 存储对话信息到 Theme表,并获取对话 id
-        theme_prompt = f'''
+# 主题命名函数：调用 qwen-flash 提取用户提问的核心意图作为主题
+def generate_theme_name(query):
+    theme_prompt = f'''
         请严格按照以下要求处理用户提问，生成对话主题：
         1. 核心要求：仅提取用户提问的核心意图，生成20字以内的简短主题；
         2. 输出规则：只返回主题文本，无任何解释、标点、多余内容；
@@ -47,10 +81,85 @@ def assistant(request):
            
         用户提问：{query}
         '''
-        theme_name = qwen.inference(
-            messages=[{'role': 'system','content': theme_prompt}],
-            model="qwen-flash",
-            max_tokens=30,
+    theme_name = qwen.inference_text(
+        messages=[{'role': 'system','content': theme_prompt}],
+        model="qwen-flash",
+        max_tokens=30,
+    )
+    if not theme_name:
+        return DEFAULT_THEME_NAME
+    return theme_name[:50]
+
+
+# RAG检索函数：根据用户提问从知识库中检索参考资料文本
+# 返回 (参考资料文本, 问题向量, 重排序得分)，问题向量同时供语义缓存使用，重排序得分供模型路由使用
+def retrieve_knowledge(query):
+    query_embedding = rag.embed_query(query)
+    chunks = rag.retrieval_chunks(query, query_embedding=query_embedding)
+    if chunks and chunks.get("documents"):
+        return "\n".join(chunks["documents"][:10]), query_embedding, chunks.get("scores", [])  # 最多10条
+    return "", query_embedding, []
+
+
+# 前置阶段提交函数：统计未结束的任务数，线程池已满（任务需要排队）时打印日志
+def submit_stage(fn, *args):
+    global _stage_pending
+    with _stage_lock:
+        _stage_pending += 1
+        pending = _stage_pending
+    if pending > STAGE_WORKERS:
+        print(f"前置阶段线程池已满：{pending} 个任务 / {STAGE_WORKERS} 个线程，新任务需排队（可调大 CHAT_STAGE_WORKERS）")
+    future = stage_executor.submit(fn, *args)
+    future.add_done_callback(_stage_done)  # 正常结束、异常、取消都会调用
+    return future
+
+
+def _stage_done(future):
+    global _stage_pending
+    with _stage_lock:
+        _stage_pending -= 1
+
+
+# 前置阶段结果获取函数：在截止时间前等待结果，超时或异常时返回降级值
+def wait_stage(future, deadline, default, stage_name):
+    try:
+        return future.result(timeout=max(0.0, deadline - time.monotonic()))
+    except FutureTimeoutError:
+        # 仍在排队的任务直接取消，不再占用线程；已开始执行的任务无法中断，结果被丢弃
+        cancelled = future.cancel()
+        print(f"{stage_name} 超时，降级处理（{'已取消排队中的任务' if cancelled else '任务仍在执行'}）")
+    except Exception as e:
+        print(f"{stage_name} 失败：{e}")
+    return default
+
+
+# 聊天上下文构建函数：主题处理 + 记忆组装 + RAG检索 + 当前提问，并保存用户提问
+# 同步接口与异步接口共用，返回调用模型所需的参数
+def build_chat_context(request):
+    # 接受客户端的 POST请求，获取请求数据
+    query = request.POST.get('query', '用户未输入任何内容')
+    user_id = int(request.POST.get('user_id', 1))
+
+    # 接收前端传入的 对话主题 id
+    theme_id = int(request.POST.get('theme_id', 0))
+
+    # --------------------------------------------------
+    # 前置阶段并发执行：主题命名 + RAG检索（主线程同时加载历史对话）
+    # --------------------------------------------------
+    stage_start = time.monotonic()
+    theme_future = submit_stage(generate_theme_name, query) if theme_id == 0 else None
+    rag_future = submit_stage(retrieve_knowledge, query)
+
+    # --------------------------------------------------
+    # 对话主题处理：无主题时自动生成并创建主题，有主题时复用
+    # --------------------------------------------------
+    if theme_future is not None:
+        # 存储对话信息到 Theme表,并获取对话 id
+        theme_name = wait_stage(
+            theme_future,
+            stage_start + STAGE_TIMEOUTS['theme_name'],
+            DEFAULT_THEME_NAME,
+            "主题命名",
         )
         theme = Theme.objects.create(
             user_id=user_id,
@@ -59,58 +168,20 @@ def assistant(request):
             update_time=timezone.now(),
         )
         theme_id = theme.id
+    else:
+        theme = Theme.objects.filter(id=theme_id, user_id=user_id).first()
 
     # 初始化模型系统提示：定义助手角色
     msg = [{'role': 'system', 'content': '你叫柠柠，是一个充满元气的专业营养师，可以根据用户的需求提供饮食建议。'}]
 
 
-    # 历史对话加载：从数据库获取当前主题下的所有有效对话记录
-    full_history = Conversation.objects.filter(
-        user_id=user_id,
-        theme_id=theme_id,
-        is_deleted=0,
-    ).order_by('id')  # 从旧到新
-
-    # 转为 Python 列表，方便切片
-    full_list = list(full_history)
-
     # --------------------------------------------------
-    # 记忆分层处理：短期记忆（最近10条）+ 长期记忆（更早记录摘要）
+    # 记忆分层处理：短期记忆（最近10条）+ 长期记忆（后台预先计算的滚动摘要）
     # --------------------------------------------------
-    long_term = []
-    long_term_summary = ""
-    if len(full_list) <= 10:
-        # 全部作为短期记忆
-        short_term = full_list
-    else:
-        short_term = full_list[-10:]  # 最近10条 → 短期
-        long_term = full_list[:-10]  # 更早的 → 需要摘要
-
-    # 如果有长期记忆，调用模型生成摘要
-    if long_term:
-        # 拼接长期记忆的对话文本（按角色+内容格式）
-        history_text = "\n".join([
-            f"[{item.role.upper()}]: {item.content}"
-            for item in long_term
-        ])
-
-        # 摘要提示词
-        summary_prompt = (f'''
-        你是一个对话摘要助手。请将以下用户与AI的历史对话内容，压缩成一段不超过100字的简洁摘要，保留核心信息和用户意图。\n\n
-        历史对话：
-        {history_text}
-        ''')
-
-        try:
-            # 调用模型生成长期记忆摘要
-            summary_resp = qwen.inference(
-                messages=[{"role": "user", "content": summary_prompt}],
-                model="qwen-flash",
-            )
-            long_term_summary = summary_resp.strip()
-        except Exception as e:
-            print(f"摘要生成失败: {e}")
-            long_term_summary = ""  # 失败时留空，不影响主流程
+    # 只加载最近的对话窗口（有界查询），更早的对话由已就绪的摘要代替
+    # 摘要更新在回复保存后由后台线程完成
+    flush_conversations(theme_id)  # 先写入缓冲队列中本主题的上一轮对话
+    long_term_summary, short_term = load_recent_history(theme, user_id, theme_id)
 
     # --------------------------------------------------
     # 记忆组装：将长期记忆摘要+短期记忆完整记录加入对话上下文
@@ -121,35 +192,39 @@ def assistant(request):
             'role': 'system',
             'content': f'【历史对话摘要】{long_term_summary}'
         })
-    # 短期记忆
+    # 短期记忆（历史图片以已生成的文字描述带入，不重复发送图片）
     for item in short_term:
-        msg.append({'role': item.role, 'content': item.content})
+        msg.append({'role': item['role'], 'content': with_caption(item['content'], item['image_caption'])})
 
     # --------------------------------------------------
-    # RAG检索：根据用户当前提问，从知识库中检索相关内容
+    # RAG检索：等待并发检索的结果（超时或失败时不加参考资料）
     # --------------------------------------------------
-    try:
-        chunks = rag.retrieval_chunks(query)
-        if chunks and chunks.get("documents"):
-            rag_text = "\n".join(chunks["documents"][:10])  # 最多10条
-            print(rag_text)
-            msg.append({
-                'role': 'system',
-                'content': f'''
-                以下是与用户问题相关的参考资料，仅供你回答时参考。
-                如果无关请忽略。
-                【参考资料】
-                {rag_text}
-                '''
-            })
-    except Exception as e:
-        print("RAG 检索失败：", e)
+    rag_text, query_embedding, rag_scores = wait_stage(
+        rag_future,
+        stage_start + STAGE_TIMEOUTS['rag'],
+        ("", None, []),
+        "RAG 检索",
+    )
+    if rag_text:
+        print(rag_text)
+        msg.append({
+            'role': 'system',
+            'content': f'''
+            以下是与用户问题相关的参考资料，仅供你回答时参考。
+            如果无关请忽略。
+            【参考资料】
+            {rag_text}
+            '''
+        })
 
     # 模型配置与图片处理
-    model = "qwen-plus"    # 默认模型
     web_flag = request.POST.get('web', '0')    # 联网搜索
     think_flag = request.POST.get('deepthink', '0')    # 深度思考
     image_url = request.POST.get('file_url',  '')    # 接收文件路径
+    # 模型路由：按提问复杂度和检索置信度选择 qwen-flash / qwen-plus（策略见 settings.MODEL_ROUTER）
+    decision = route_query(query, rag_scores, enable_thinking=think_flag == '1')
+    model = decision["model"]
+    route = decision["route"]
 
     # --------------------------------------------------
     # 加入用户当前的最新提问 + 图片处理逻辑
@@ -157,10 +232,12 @@ def assistant(request):
     if image_url:    # 如果有图片上传
         # 更换为有视觉处理能力的模型
         model = "qwen3-vl-plus"
-        # 获取文件格式后缀
-        file_extension = os.path.splitext(image_url)[1]
-        # 将图片转为base64编码
-        base64_image = encode_image(os.path.join(settings.BASE_DIR, image_url[1:]))
+        route = "vision"
+        # 获取压缩后图片的 base64 data URI（上传时已预处理，命中缓存时不读磁盘）
+        image_data = image_pipeline.data_uri(
+            os.path.join(settings.BASE_DIR, image_url[1:]),
+            digest=digest_from_url(image_url),  # 内容寻址文件名即哈希，无需读取原图
+        )
         msg.append(
             {
                 'role': 'user',
@@ -168,7 +245,7 @@ def assistant(request):
                     {
                         'type': 'image_url',
                         'image_url': {
-                            'url': f"data:image/{file_extension};base64,{base64_image}",
+                            'url': image_data,
                         },
                     },
                     {'type': 'text', 'text': query}
@@ -177,9 +254,10 @@ def assistant(request):
         )
     else:    # 如果没有图片上传
         msg.append({'role': 'user', 'content': query})
+        print(f"模型路由：{decision}")
 
     # 保存用户的对话内容到 Conversation表 -> 查询完历史后，调用模型之前保存
-    Conversation.objects.create(
+    save_conversation(
         theme_id=theme_id,
         user_id=user_id,
         role='user',
@@ -188,50 +266,167 @@ def assistant(request):
         update_time=timezone.now(),
         image_url=image_url,
     )
+    if image_url:
+        # 后台为图片生成一次文字描述，供后续轮次追问时使用
+        schedule_caption(qwen, image_pipeline, theme_id, user_id, image_url)
+
+    # --------------------------------------------------
+    # 语义缓存：仅纯文本、未联网、且主题内无历史对话的提问参与缓存
+    # （有历史上下文时回答依赖前文，不能跨对话复用）
+    # --------------------------------------------------
+    cached_answer = None
+    cache_slot = None
+    if (semantic_cache is not None and query_embedding is not None
+            and not image_url and web_flag != '1'
+            and not short_term and not long_term_summary):
+        namespace = SemanticCache.make_namespace(model, False, think_flag == '1', rag_text)
+        cached_answer = semantic_cache.lookup(query_embedding, namespace)
+        print(f"语义缓存{'命中' if cached_answer is not None else '未命中'}：{semantic_cache.stats()}")
+        if cached_answer is None:
+            # 未命中：回答生成完成后写入缓存
+            cache_slot = (query_embedding, namespace)
+
+    return {
+        "theme_id": theme_id,
+        "user_id": user_id,
+        "messages": msg,
+        "model": model,
+        "route": route,
+        "enable_search": web_flag == '1',
+        "enable_thinking": think_flag == '1',
+        "cached_answer": cached_answer,
+        "cache_slot": cache_slot,
+    }
 
-    # 调用QwenLLM类的inference方法，获取模型回复
-    answer = qwen.inference(
-        messages=msg,
-        model=model,
-        stream=True,  # 是否流式返回
-        enable_search=web_flag == '1',
-        enable_thinking=think_flag == '1',
+
+# 助手回复保存函数：保存到 Conversation表，并触发后台摘要
+def save_assistant_reply(theme_id, user_id, content):
+    save_conversation(
+        theme_id=theme_id,
+        user_id=user_id,
+        role='assistant',
+        content=content,
+        create_time=timezone.now(),
+        update_time=timezone.now(),
     )
+    # 回复保存后，后台预先计算下一轮要用的长期记忆摘要
+    schedule_summary(qwen, theme_id, user_id)
+
+
+# SSE 数据块格式化函数
+# SSE 协议要求：事件数据块必须以 "data: "开头，之间必须用 "\n\n" 分隔
+def sse_data(text):
+    return f"data: {text.replace("\n", "\\n")}\n\n"
+
+
+# 模型流式响应文本提取函数（同步），meter 记录首字延迟和 token 用量
+def stream_text(answer, meter=None):
+    for chunk in answer:
+        if meter is not None:
+            meter.observe(chunk)
+        if chunk.choices:
+            delta = chunk.choices[0].delta or ""
+            if delta and delta.content:
+                yield delta.content
+
+
+# 模型流式响应文本提取函数（异步）
+async def astream_text(answer, meter=None):
+    async for chunk in answer:
+        if meter is not None:
+            meter.observe(chunk)
+        if chunk.choices:
+            delta = chunk.choices[0].delta or ""
+            if delta and delta.content:
+                yield delta.content
+
+
+# 模型流式响应关闭函数（同步 / 异步）：未读完的响应不关闭会一直占用连接池中的连接
+# 模型调用失败时 answer 为错误文本，缓存命中时为 None，均无需关闭
+def close_stream(answer):
+    close = getattr(answer, "close", None)
+    if callable(close):
+        close()
+
+
+async def aclose_stream(answer):
+    close = getattr(answer, "close", None)
+    if callable(close):
+        await close()
+
+
+# 缓存回答回放函数：按小片段输出，与模型流式输出的格式一致
+def replay_text(text, size=16):
+    for i in range(0, len(text), size):
+        yield text[i:i + size]
+
+
+async def areplay_text(text, size=16):
+    for piece in replay_text(text, size):
+        yield piece
+
+
+# SSE 响应构建函数：同步生成器与异步生成器均可
+def sse_response(stream):
+    response = StreamingHttpResponse(stream, content_type="text/event-stream")
+    # 设置缓存控制：只要有yield产生的数据，就立即响应到客户端，不要缓存
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # 禁止 Nginx 缓冲
+    return response
+
+
+# ===================== 核心业务接口 =====================
+# 助手聊天接口：处理用户对话请求
+def assistant(request):
+    ctx = build_chat_context(request)
+    theme_id = ctx["theme_id"]
+    user_id = ctx["user_id"]
+
+    meter = None  # 语义缓存命中时没有模型调用，不计入路由统计
+    answer = None
+    if ctx["cached_answer"] is not None:
+        # 语义缓存命中：直接回放缓存的回答，不再调用模型
+        pieces = replay_text(ctx["cached_answer"])
+    else:
+        meter = route_stats.start(ctx["route"], ctx["model"])
+        # 调用QwenLLM类的inference方法，获取模型回复
+        answer = qwen.inference(
+            messages=ctx["messages"],
+            model=ctx["model"],
+            stream=True,  # 是否流式返回
+            enable_search=ctx["enable_search"],
+            enable_thinking=ctx["enable_thinking"],
+            include_usage=True,  # 最后一个数据块附带 token 用量
+        )
+        pieces = stream_text(answer, meter)
 
     # 流式推理函数
     def event_stream():
         content = ""  # 用于更新数据库
+        completed = False  # 是否完整生成（仅完整的回答写入语义缓存）
         try:
             # 响应对话主题id到客户端
-            # SSE 协议要求：事件数据块必须以 "data: "开头，之间必须用 "\n\n" 分隔
             yield "data: <theme_id_1>" + str(theme_id) + "<theme_id_1>\n\n"
             # 流式输出
-            for chunk in answer:
-                if chunk.choices:
-                    delta = chunk.choices[0].delta or ""
-                    if delta and delta.content:
-                        content += delta.content
-                        yield f"data: {delta.content.replace("\n", "\\n")}\n\n"
+            for piece in pieces:
+                content += piece
+                yield sse_data(piece)
+            completed = True
         except Exception as e:
             print(f"流式推理过程发生错误：{e}")
         finally:
+            # 先关闭模型流式响应：客户端中途断开时也能释放连接回连接池
+            close_stream(answer)
             # 把结束标志发送到客户端
             yield "data: [@#--END--#@]\n\n"
+            if meter is not None:
+                meter.finish(completed)
             # 保存助手的回复到 Conversation表
-            Conversation.objects.create(
-                theme_id=theme_id,
-                user_id=user_id,
-                role='assistant',
-                content=content,
-                create_time=timezone.now(),
-                update_time=timezone.now(),
-            )
-
-    response = StreamingHttpResponse(event_stream(), content_type="text/event-stream")
-    # 设置缓存控制：只要有yield产生的数据，就立即响应到客户端，不要缓存
-    response["Cache-Control"] = "no-cache"
-    response["X-Accel-Buffering"] = "no"  # 禁止 Nginx 缓冲
-    return response
+            save_assistant_reply(theme_id, user_id, content)
+            if completed and content and ctx["cache_slot"] is not None:
+                semantic_cache.store(*ctx["cache_slot"], content)
+
+    return sse_response(event_stream())
     # data = {
     #     "status": "success",
     #     "message": query,
@@ -243,26 +438,84 @@ def assistant(request):
     # return JsonResponse(data)
 
 
+# 异步助手聊天接口（ASGI）：与 assistant 接口协议一致
+# 流式生成期间不占用工作线程，单进程可同时保持大量 SSE 连接
+async def assistant_async(request):
+    # 上下文构建包含数据库读写和线程池等待，放到同步线程中执行
+    ctx = await sync_to_async(build_chat_context)(request)
+    theme_id = ctx["theme_id"]
+    user_id = ctx["user_id"]
+
+    meter = None  # 语义缓存命中时没有模型调用，不计入路由统计
+    answer = None
+    if ctx["cached_answer"] is not None:
+        # 语义缓存命中：直接回放缓存的回答，不再调用模型
+        pieces = areplay_text(ctx["cached_answer"])
+    else:
+        meter = route_stats.start(ctx["route"], ctx["model"])
+        # 调用AsyncQwenLLM类的inference方法，获取模型回复
+        answer = await async_qwen.inference(
+            messages=ctx["messages"],
+            model=ctx["model"],
+            stream=True,  # 是否流式返回
+            enable_search=ctx["enable_search"],
+            enable_thinking=ctx["enable_thinking"],
+            include_usage=True,  # 最后一个数据块附带 token 用量
+        )
+        pieces = astream_text(answer, meter)
+
+    # 异步流式推理函数
+    async def event_stream():
+        content = ""  # 用于更新数据库
+        completed = False  # 是否完整生成（仅完整的回答写入语义缓存）
+        try:
+            # 响应对话主题id到客户端
+            yield "data: <theme_id_1>" + str(theme_id) + "<theme_id_1>\n\n"
+            # 流式输出
+            async for piece in pieces:
+                content += piece
+                yield sse_data(piece)
+            completed = True
+        except Exception as e:
+            print(f"流式推理过程发生错误：{e}")
+        finally:
+            # 先关闭模型流式响应：客户端中途断开时也能释放连接回连接池
+            await aclose_stream(answer)
+            # 把结束标志发送到客户端
+            yield "data: [@#--END--#@]\n\n"
+            if meter is not None:
+                meter.finish(completed)
+            # 保存助手的回复到 Conversation表
+            await sync_to_async(save_assistant_reply)(theme_id, user_id, content)
+            if completed and content and ctx["cache_slot"] is not None:
+                semantic_cache.store(*ctx["cache_slot"], content)
+
+    return sse_response(event_stream())
+
+
 # 文件上传接口：接收前端上传的图片文件，保存并返回文件路径
 def uploadfile(request):
-    # 接受客户端提交的文件
-    file = request.FILES.get('file_1')
     # 创建 FileSystemStorage 对象
     fs = FileSystemStorage(
         location=str(settings.BASE_DIR / "static" / "uploads"),  # 文件保存的物理路径
         base_url=settings.STATIC_URL + "uploads/",               # 文件访问的URL前缀
     )
 
-    # 生成带时间戳的文件名
-    org_name = file.name
-    ext = os.path.splitext(org_name)[1]  # 如 ".jpg"、".png"
-    timestamp = time.strftime('%Y%m%d%H%M%S', time.localtime())
-    new_name = f"{org_name}_{timestamp}{ext}"
-    
-    # 保存文件
-    filename = fs.save(new_name, file)
-    # 获取文件地址
-    file_url = request.build_absolute_uri(fs.url(filename))
+    # 请求体超限：直接拒绝，不读取请求体（预留 64KB 给 multipart 边界和其他表单字段）
+    if int(request.META.get('CONTENT_LENGTH') or 0) > UPLOAD_MAX_SIZE + 64 * 1024:
+        return JsonResponse({"message": "文件过大"}, status=413)
+
+    # 接受客户端提交的文件：边接收边写盘并计算 SHA-256，按内容哈希命名保存（相同内容只保存一份）
+    handler = HashingUploadHandler(request, fs.location, UPLOAD_TEMP_DIR, UPLOAD_MAX_SIZE)
+    request.upload_handlers = [handler]
+    file = request.FILES.get('file_1')
+    if file is None:
+        return JsonResponse({"message": handler.error or "未收到文件"}, status=400)
+
+    # 获取文件地址（重复上传时返回已有文件的地址）
+    file_url = request.build_absolute_uri(fs.url(file.name))
+    # 后台预处理图片：生成压缩版本（对话时直接使用；重复上传时已存在，直接返回）
+    image_executor.submit(image_pipeline.prepare, file.path, file.digest)
 
     data = {
         "status": "success", 
@@ -272,61 +525,157 @@ def uploadfile(request):
     return JsonResponse(data)
 
 
+# 历史主题列表的 keyset 条件：按 (创建时间, id) 倒序排在给定主题之后的主题（游标分页与流式导出共用）
+def themes_after(row):
+    return Q(create_time__lt=row['create_time']) | Q(create_time=row['create_time'], id__lt=row['id'])
+
+
 # 对话主题列表接口：获取指定用户的所有有效对话主题
+# 可选参数：limit（每页条数，不传则返回全部）、cursor（上一页返回的 next_cursor）、stream=1（流式导出全部）
 def history(request):
     # 接收用户 id
     user_id = int(request.POST.get('user_id', 0))
     # print("DEBUG user_id =", user_id)
-    # 获取历史对话主题列表：加 - 表示按创建时间降序排序
-    themes = Theme.objects.filter(user_id=user_id, is_deleted=0).order_by('-create_time')
-    # 初始化历史消息列表
-    history_list = []
-    for theme in themes:
-        history_list.append({
-            "theme_id": theme.id,
-            "theme_name": theme.theme_name,
-            "create_time": theme.create_time.strftime("%Y-%m-%d %H:%M:%S"),
-        })
-    # 响应到客户端
+    try:
+        limit = parse_limit(request.POST.get('limit'))
+        cursor = decode_cursor(request.POST.get('cursor'))
+        cursor_time = cursor_id = None
+        if cursor is not None:
+            # 游标为 [创建时间, 主题 id]
+            if len(cursor) != 2:
+                raise ValueError('cursor 格式错误')
+            cursor_time = parse_datetime(cursor[0])
+            cursor_id = int(cursor[1])
+            if cursor_time is None:
+                raise ValueError('cursor 格式错误')
+    except (ValueError, TypeError):
+        return JsonResponse({"message": "分页参数错误"}, status=400)
+
+    # 获取历史对话主题列表：加 - 表示按创建时间降序排序（创建时间相同时按 id 降序，保证游标稳定）
+    themes = Theme.objects.filter(user_id=user_id, is_deleted=0).order_by(
+        '-create_time', '-id'
+    ).values('id', 'theme_name', 'create_time')
+
+    def format_theme(row):
+        return {
+            "theme_id": row['id'],
+            "theme_name": row['theme_name'],
+            "create_time": row['create_time'].strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
     data = {
         "status": "success",
         "message": "对话历史记录接口",
-        "history_list": history_list,
     }
+    # 流式导出：逐批读取并分段输出，不在内存中构建完整列表
+    if request.POST.get('stream') == '1':
+        rows = iter_pages(themes, themes_after)
+        return StreamingHttpResponse(
+            stream_json(data, "history_list", rows, format_theme),
+            content_type='application/json',
+        )
+
+    if limit is None:
+        # 不分页：兼容旧版客户端
+        data["history_list"] = [format_theme(row) for row in themes]
+        return JsonResponse(data)
+
+    # 游标分页：从上一页最后一个主题之后继续
+    if cursor is not None:
+        themes = themes.filter(themes_after({'create_time': cursor_time, 'id': cursor_id}))
+    rows, has_more = fetch_page(themes, limit)
+    data["history_list"] = [format_theme(row) for row in rows]
+    data["next_cursor"] = (
+        encode_cursor(rows[-1]['create_time'].isoformat(), rows[-1]['id']) if has_more else None
+    )
+    # 响应到客户端
     return JsonResponse(data)
 
 
-# 历史对话详情接口：获取指定主题下的所有对话记录
+# 历史对话详情接口：获取指定主题下的对话记录
+# 可选参数：limit（返回最近的 limit 条，不传则返回全部）、cursor（上一页返回的 next_cursor，继续加载更早的记录）、
+#          stream=1（流式导出全部）
 def continue_history(request):
     # 接收前端传入的参数：用户id + 对话主题id
     user_id = int(request.POST.get('user_id', 0))
     theme_id = int(request.POST.get('theme_id', 0))
-
-    # 查询历史对话消息
+    try:
+        limit = parse_limit(request.POST.get('limit'))
+        cursor = decode_cursor(request.POST.get('cursor'))
+        before_id = None
+        if cursor is not None:
+            # 游标为 [对话 id]
+            if len(cursor) != 1:
+                raise ValueError('cursor 格式错误')
+            before_id = int(cursor[0])
+    except (ValueError, TypeError):
+        return JsonResponse({"message": "分页参数错误"}, status=400)
+
+    # 查询历史对话消息（先写入缓冲队列中本主题的对话）
+    flush_conversations(theme_id)
     info = Conversation.objects.filter(
         theme_id=theme_id,
         user_id=user_id,
         is_deleted=0,  # 0 表示未删除
-    ).order_by('id')
+    ).values('id', 'role', 'content', 'image_url')
 
     # 格式化聊天记录
-    chat_list = []
-    for item in info:
-        chat_list.append({
-            "role": item.role,
-            "content": item.content,
-            "image_url": (
-                request.build_absolute_uri('/')[:-1] + item.image_url
-                if item.image_url else ""
-            )
-        })
+    base_url = request.build_absolute_uri('/')[:-1]
+
+    def format_chat(row):
+        return {
+            "role": row['role'],
+            "content": row['content'],
+            "image_url": base_url + row['image_url'] if row['image_url'] else "",
+        }
+
     data = {
         "status": "success",
         "message": "获取历史对话接口",
-        "chat": chat_list,
     }
+    # 流式导出：逐批读取并分段输出，不在内存中构建完整列表
+    if request.POST.get('stream') == '1':
+        rows = iter_pages(info.order_by('id'), lambda row: Q(id__gt=row['id']))
+        return StreamingHttpResponse(
+            stream_json(data, "chat", rows, format_chat),
+            content_type='application/json',
+        )
+
+    if limit is None:
+        # 不分页：兼容旧版客户端
+        data["chat"] = [format_chat(row) for row in info.order_by('id')]
+        return JsonResponse(data)
+
+    # 游标分页：从最新的记录往前翻页，每页内按时间正序返回
+    if before_id is not None:
+        info = info.filter(id__lt=before_id)
+    rows, has_more = fetch_page(info.order_by('-id'), limit)
+    rows.reverse()
+    data["chat"] = [format_chat(row) for row in rows]
+    data["next_cursor"] = encode_cursor(rows[0]['id']) if has_more else None
     return JsonResponse(data)
 
+# 批量删除接口单次最多删除的主题数
+MAX_DELETE_THEMES = 200
+
+
+# 逻辑删除函数：在同一事务中标记主题及其对话记录（每张表一条 UPDATE）
+def soft_delete_themes(user_id, theme_ids):
+    flush_conversations(*theme_ids)  # 缓冲队列中的对话也要一并标记删除
+    now = timezone.now()
+    with transaction.atomic():
+        Conversation.objects.filter(
+            user_id=user_id,
+            theme_id__in=theme_ids,
+            is_deleted=0,  # 已删除的记录保留原删除时间（用于到期清理）
+        ).update(is_deleted=1, delete_time=now)
+        return Theme.objects.filter(
+            id__in=theme_ids,
+            user_id=user_id,
+            is_deleted=0,
+        ).update(is_deleted=1, delete_time=now)
+
+
 # 对话主题删除接口：逻辑删除指定主题及关联的所有对话记录
 def del_theme(request):
     # 接收前端传入的参数：用户id + 对话主题id
@@ -342,15 +691,39 @@ def del_theme(request):
     # Theme.objects.filter(id=theme_id, user_id=user_id).delete()
 
     # ------------------------------
-    # 逻辑删除：仅标记删除状态，不删除数据库数据
+    # 逻辑删除：仅标记删除状态，不删除数据库数据（超过保留期后由 purge_deleted 命令清理）
     # ------------------------------
-    Conversation.objects.filter(theme_id=theme_id, user_id=user_id).update(is_deleted=1)
-    Conversation.objects.filter(theme_id=theme_id, user_id=user_id).update(delete_time=timezone.now())
-    Theme.objects.filter(id=theme_id, user_id=user_id).update(is_deleted=1)
-    Theme.objects.filter(id=theme_id, user_id=user_id).update(delete_time=timezone.now())
+    soft_delete_themes(user_id, [theme_id])
 
     data = {
         "status": "success",
         "message": "删除历史对话记录接口",
     }
     return JsonResponse(data)
+
+
+# 批量删除接口：一次逻辑删除多个主题
+# theme_ids 可以重复传参（theme_ids=1&theme_ids=2），也可以用逗号分隔（theme_ids=1,2）
+def del_themes(request):
+    user_id = int(request.POST.get('user_id', 0))
+    try:
+        theme_ids = {
+            int(value)
+            for raw in request.POST.getlist('theme_ids')
+            for value in raw.split(',') if value.strip()
+        }
+    except ValueError:
+        return JsonResponse({"message": "主题id格式错误"}, status=400)
+    if not theme_ids:
+        return JsonResponse({"message": "主题id为空"}, status=400)
+    if len(theme_ids) > MAX_DELETE_THEMES:
+        return JsonResponse({"message": f"单次最多删除 {MAX_DELETE_THEMES} 个主题"}, status=400)
+
+    deleted = soft_delete_themes(user_id, theme_ids)
+
+    data = {
+        "status": "success",
+        "message": "批量删除历史对话记录接口",
+        "deleted": deleted,
+    }
+    return JsonResponse(data)
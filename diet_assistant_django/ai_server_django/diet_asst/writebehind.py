@@ -0,0 +1,149 @@
+"""
+对话写入缓冲模块：Conversation 记录的异步批量写入（write-behind）
+
+功能说明：
+- 开启后，每轮对话的用户提问 / 助手回复不再各自单独 INSERT，
+  而是先放入内存队列，由后台线程按时间间隔或条数阈值用 bulk_create 批量写入
+- 读取前刷新：加载历史对话、删除主题、后台摘要等读取 / 修改对话表之前调用 flush_conversations(主题id)，
+  只有这些主题在队列中（或正在写入）有记录时才同步刷新，其他请求不等待批量写入
+- 写入失败：整批 bulk_create 失败时逐条重试，仍然失败的记录打印日志后丢弃（例如超长的 image_url），
+  不会阻塞后续记录，也不会把异常抛给请求
+- 退出时刷新：进程正常退出（含 gunicorn/uvicorn 收到 SIGTERM 后的正常退出）时通过 atexit 写入剩余记录
+- 默认关闭（settings.CONVERSATION_WRITE_BEHIND），关闭时行为与直接 create() 一致
+- 注意：队列在进程内存中，多进程部署时各进程独立缓冲；进程被强制杀死（SIGKILL）时
+  最多丢失一个刷新间隔内的记录
+"""
+
+import atexit
+import threading
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from .models import Conversation
+
+
+# =================================================
+# ConversationWriteBuffer：对话记录写入缓冲
+# 对外提供 save / flush / close 方法
+# =================================================
+class ConversationWriteBuffer:
+    def __init__(self, flush_interval=0.5, max_batch=200):
+        """
+        Args:
+            flush_interval (float): 最长刷新间隔（秒）
+            max_batch (int): 队列达到该条数时立即刷新（也是单次 bulk_create 的批大小）
+        """
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._pending = []
+        self._inflight = []  # 已取出、正在写入的记录
+        self._lock = threading.Lock()  # 保护 _pending / _inflight
+        self._flush_lock = threading.Lock()  # 保证同一时间只有一个线程在写库（保持插入顺序）
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="conversation-writer", daemon=True)
+        self._thread.start()
+
+    def save(self, **fields):
+        """放入队列（字段与 Conversation.objects.create 一致）"""
+        with self._lock:
+            self._pending.append(Conversation(**fields))
+            full = len(self._pending) >= self.max_batch
+        if full:
+            self._wakeup.set()
+
+    def has_pending(self, theme_ids):
+        """指定主题是否有尚未写入数据库的记录（含正在写入的批次）"""
+        theme_ids = {int(theme_id) for theme_id in theme_ids}
+        with self._lock:
+            return any(
+                item.theme_id in theme_ids
+                for item in self._inflight + self._pending
+            )
+
+    def flush(self):
+        """把队列中的记录全部写入数据库，返回写入条数（写入失败的记录丢弃，不抛出异常）"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+                self._inflight = batch
+            if not batch:
+                return 0
+            try:
+                return self._write(batch)
+            finally:
+                with self._lock:
+                    self._inflight = []
+
+    def _write(self, batch):
+        # 每次写入放在独立的事务 / 保存点中：失败时只回滚本次写入，调用方已开启的事务仍可继续使用
+        try:
+            with transaction.atomic():
+                Conversation.objects.bulk_create(batch, batch_size=self.max_batch)
+            return len(batch)
+        except Exception as e:
+            print(f"对话批量写入失败，改为逐条写入: {e}")
+
+        # 逐条重试：只丢弃本身无法写入的记录
+        written = 0
+        for item in batch:
+            item.pk = None  # 整批回滚后，已分配的主键不再有效
+            try:
+                with transaction.atomic():
+                    item.save(force_insert=True)
+                written += 1
+            except Exception as e:
+                print(f"对话写入失败，已丢弃（theme_id={item.theme_id}, role={item.role}）: {e}")
+        return written
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            finally:
+                # 后台线程不经过请求周期，需要手动释放过期的数据库连接
+                close_old_connections()
+
+    def close(self):
+        """停止后台线程并写入剩余记录（进程退出时调用）"""
+        self._closed = True
+        self._wakeup.set()
+        self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+
+# 写入缓冲配置（默认关闭）
+WRITE_BEHIND = getattr(settings, 'CONVERSATION_WRITE_BEHIND', {})
+conversation_buffer = ConversationWriteBuffer(
+    flush_interval=WRITE_BEHIND.get('flush_interval', 0.5),
+    max_batch=WRITE_BEHIND.get('max_batch', 200),
+) if WRITE_BEHIND.get('enabled') else None
+
+if conversation_buffer is not None:
+    atexit.register(conversation_buffer.close)
+
+
+# =================================================
+# 对外函数：保存对话 / 读取前刷新
+# =================================================
+def save_conversation(**fields):
+    """保存一条对话记录：开启缓冲时放入队列，否则直接写库"""
+    if conversation_buffer is None:
+        Conversation.objects.create(**fields)
+    else:
+        conversation_buffer.save(**fields)
+
+
+def flush_conversations(*theme_ids):
+    """
+    读取 / 修改对话表之前调用：指定主题在本进程队列中有记录时，先写入队列中的记录
+
+    Args:
+        *theme_ids (int): 将要读取 / 修改的主题 id；不传时无条件刷新
+    """
+    if conversation_buffer is None:
+        return
+    if theme_ids and not conversation_buffer.has_pending(theme_ids):
+        return
+    conversation_buffer.flush()
@@ -0,0 +1,159 @@
+"""
+BM25Index 模块
+
+功能说明：
+- 基于 jieba 分词的 BM25 倒排索引，弥补向量召回对精确食物名称、数字不敏感的问题
+- 索引由 MarkdownRAGProcessor 生成的同一批知识块（knowledges.jsonl，兼容旧的 knowledges.json）构建，
+  知识块 id 与 数据处理_添加到VDB.py 的生成规则一致，可与向量召回结果直接融合
+- 索引预先构建并保存为 JSON 文件，服务启动时直接加载
+- 未安装 jieba 时退化为 单字 + 双字 切分（中文）和整词切分（英文/数字）
+"""
+
+import hashlib
+import json
+import math
+import re
+from collections import Counter, defaultdict
+from pathlib import Path
+
+try:
+    import jieba  # 可选依赖：中文分词
+except ImportError:
+    jieba = None
+
+
+# 分词时丢弃的标点/空白
+_PUNCT = re.compile(r"[\s　，。！？、；：“”‘’（）《》【】,.!?;:\"'()\[\]<>|/\\\-_=+*#&%$@~`^]+")
+
+
+# =================================================
+# 知识块 id：与 数据处理_添加到VDB.py 中的生成规则一致
+# =================================================
+def chunk_id(chunk):
+    return hashlib.md5(
+        (chunk["content"] + str(chunk["metadata"])).encode('utf-8')
+    ).hexdigest()
+
+
+# =================================================
+# 分词
+# =================================================
+def tokenize(text):
+    text = text.lower()
+    if jieba is not None:
+        # 搜索引擎模式：长词再切分出短词，提高召回
+        return [t for t in jieba.lcut_for_search(text) if t.strip() and not _PUNCT.fullmatch(t)]
+
+    tokens = []
+    for segment in _PUNCT.split(text):
+        # 英文单词和数字整体保留，中文按单字 + 双字切分
+        for word in re.findall(r"[a-z0-9.]+|[一-鿿]+", segment):
+            if word[0] < "一":
+                tokens.append(word)
+            else:
+                tokens.extend(word)
+                tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+# =================================================
+# BM25Index：BM25 倒排索引
+# 对外提供 build / save / load / query 方法
+# =================================================
+class BM25Index:
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids, self.documents, self.metadatas = [], [], []
+        self.doc_lengths = []
+        self.avg_length = 0.0
+        self.postings = {}  # 词 -> [[文档序号, 词频], ...]
+        self.idf = {}
+
+    # =================================================
+    # 从知识块列表构建索引
+    # =================================================
+    def build(self, chunks):
+        postings = defaultdict(list)
+        for chunk in chunks:
+            doc_index = len(self.ids)
+            self.ids.append(chunk_id(chunk))
+            self.documents.append(chunk["content"])
+            self.metadatas.append(chunk["metadata"])
+            tokens = tokenize(chunk["content"])
+            self.doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                postings[term].append([doc_index, tf])
+
+        self.postings = dict(postings)
+        self._finalize()
+        return self
+
+    def _finalize(self):
+        n = len(self.ids)
+        self.avg_length = sum(self.doc_lengths) / n if n else 0.0
+        self.idf = {
+            term: math.log((n - len(docs) + 0.5) / (len(docs) + 0.5) + 1)
+            for term, docs in self.postings.items()
+        }
+
+    # =================================================
+    # 保存 / 加载索引文件
+    # =================================================
+    def save(self, path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({
+                "k1": self.k1,
+                "b": self.b,
+                "ids": self.ids,
+                "documents": self.documents,
+                "metadatas": self.metadatas,
+                "doc_lengths": self.doc_lengths,
+                "postings": self.postings,
+            }, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls(k1=data["k1"], b=data["b"])
+        index.ids = data["ids"]
+        index.documents = data["documents"]
+        index.metadatas = data["metadatas"]
+        index.doc_lengths = data["doc_lengths"]
+        index.postings = data["postings"]
+        index._finalize()
+        print(f"✅ 加载 BM25 索引: {len(index.ids)} 个知识块")
+        return index
+
+    # =================================================
+    # 检索：返回得分最高的 n_results 个文档序号
+    # =================================================
+    def query(self, question, n_results=30):
+        scores = defaultdict(float)
+        for term in set(tokenize(question)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = self.idf[term]
+            for doc_index, tf in docs:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_index] / self.avg_length)
+                scores[doc_index] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores, key=scores.get, reverse=True)[:n_results]
+
+
+if __name__ == "__main__":
+    """
+    使用示例：在生成 ./chunks/knowledges.jsonl 后构建 BM25 索引
+    之后在 asst.env 中设置 BM25_INDEX_PATH 指向生成的索引文件即可启用混合检索
+    """
+    import sys
+
+    # 允许直接以脚本方式运行（python utils/BM25Index.py）
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from utils.ChunkFile import default_chunks_path, iter_chunks
+
+    index = BM25Index().build(iter_chunks(default_chunks_path("./chunks")))
+    index.save("./chunks/bm25_index.json")
+    print(f"💾 BM25 索引已保存: {len(index.ids)} 个知识块 → ./chunks/bm25_index.json")
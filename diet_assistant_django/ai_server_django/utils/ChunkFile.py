@@ -0,0 +1,87 @@
+"""
+ChunkFile 模块
+
+功能说明：
+- 知识块文件的流式读写，供 MarkdownRAGProcessor（写）和 知识库导入 / BM25 索引 / 性能测试脚本（读）共用
+- 新格式：JSONL（每行一个知识块 {"metadata": {...}, "content": "..."}）
+  * 写入端每处理完一个文件就追加并刷盘，内存占用与语料规模无关
+  * 读取端逐行解析，无需把整个文件读入内存
+- 兼容旧格式：整个 JSON 数组（knowledges.json），读取时整体加载后逐条产出
+"""
+
+import json
+import os
+from pathlib import Path
+
+
+# =================================================
+# 默认知识块文件：优先使用 JSONL，不存在时回退到旧的 JSON 文件
+# =================================================
+def default_chunks_path(chunks_dir="./chunks"):
+    chunks_dir = Path(chunks_dir)
+    jsonl_path = chunks_dir / "knowledges.jsonl"
+    return jsonl_path if jsonl_path.exists() else chunks_dir / "knowledges.json"
+
+
+# =================================================
+# 读取：逐条产出知识块
+# =================================================
+def iter_chunks(path):
+    with open(path, "r", encoding="utf-8") as f:
+        # 根据首个非空白字符判断格式：'[' 为旧的 JSON 数组，否则为 JSONL
+        head = f.read(1)
+        while head and head.isspace():
+            head = f.read(1)
+        f.seek(0)
+        if head == "[":
+            yield from json.load(f)
+            return
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path} 第 {line_no} 行不是合法的 JSON: {e}") from e
+
+
+# =================================================
+# ChunkWriter：JSONL 增量写入
+# 先写入 <文件名>.partial，close 时原子替换为目标文件：
+# 中途崩溃不会留下被当作完整知识库的半截文件
+# =================================================
+class ChunkWriter:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)  # 确保输出目录存在
+        self.partial_path = self.path.with_name(self.path.name + ".partial")
+        self._file = open(self.partial_path, "w", encoding="utf-8")
+        self.count = 0
+
+    def write(self, chunk):
+        # ensure_ascii=False：保留中文
+        self._file.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+        self.count += 1
+
+    def flush(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.close()
+        os.replace(self.partial_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # 异常退出：保留 .partial 文件便于排查，不覆盖已有的完整知识库
+            self._file.close()
+        return False
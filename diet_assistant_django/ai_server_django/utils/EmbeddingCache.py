@@ -0,0 +1,148 @@
+"""
+EmbeddingCache 模块
+
+功能说明：
+- 缓存问题文本的向量，避免相同问题重复调用远程 Embedding API
+- 缓存键：规范化后的文本 + 向量模型名（更换模型后不会误用旧向量）
+- 提供三种缓存层，可组合使用：
+  * LRUEmbeddingCache：进程内 LRU 缓存（一级缓存，最快）
+  * SQLiteEmbeddingCache：本地 SQLite 文件缓存（进程重启后仍有效，多进程共享）
+  * RedisEmbeddingCache：Redis 缓存（多机共享，需安装 redis 库）
+- TieredEmbeddingCache：一级缓存未命中时查询二级缓存，并回填一级缓存
+"""
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+
+
+# =================================================
+# 缓存键：规范化文本 + 模型名
+# =================================================
+def make_key(text, model_name):
+    # NFKC 统一全角/半角字符，合并空白，英文统一小写
+    normalized = unicodedata.normalize("NFKC", text)
+    normalized = re.sub(r"\s+", " ", normalized).strip().lower()
+    return hashlib.md5(f"{model_name}|{normalized}".encode('utf-8')).hexdigest()
+
+
+# =================================================
+# 进程内 LRU 缓存
+# =================================================
+class LRUEmbeddingCache:
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            embedding = self._data.get(key)
+            if embedding is not None:
+                self._data.move_to_end(key)  # 更新 LRU 顺序
+            return embedding
+
+    def set(self, key, embedding):
+        with self._lock:
+            self._data[key] = embedding
+            self._data.move_to_end(key)
+            # 超出容量：淘汰最久未使用的条目
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+
+# =================================================
+# SQLite 文件缓存
+# =================================================
+class SQLiteEmbeddingCache:
+    def __init__(self, path="./embedding_cache.sqlite3"):
+        self.path = path
+        # 每个线程使用独立连接（sqlite3 连接不能跨线程共享）
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS embedding_cache (key TEXT PRIMARY KEY, embedding TEXT NOT NULL)"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)  # 自动提交
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute(
+            "SELECT embedding FROM embedding_cache WHERE key = ?", (key,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, embedding):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO embedding_cache (key, embedding) VALUES (?, ?)",
+            (key, json.dumps(embedding)),
+        )
+
+
+# =================================================
+# Redis 缓存（可选依赖）
+# =================================================
+class RedisEmbeddingCache:
+    def __init__(self, url="redis://localhost:6379/0", ttl=7 * 24 * 3600, prefix="emb:"):
+        import redis  # 可选依赖：仅在使用 Redis 缓存时需要安装
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return json.loads(value) if value else None
+
+    def set(self, key, embedding):
+        self.client.set(self.prefix + key, json.dumps(embedding), ex=self.ttl)
+
+
+# =================================================
+# 两级缓存：一级（进程内）+ 二级（SQLite / Redis）
+# =================================================
+class TieredEmbeddingCache:
+    def __init__(self, l1, l2=None):
+        self.l1 = l1
+        self.l2 = l2
+
+    def get(self, key):
+        embedding = self.l1.get(key)
+        if embedding is None and self.l2 is not None:
+            try:
+                embedding = self.l2.get(key)
+            except Exception as e:
+                # 二级缓存故障不影响检索，退化为只用一级缓存
+                print(f"二级向量缓存读取失败：{e}")
+                embedding = None
+            if embedding is not None:
+                self.l1.set(key, embedding)  # 回填一级缓存
+        return embedding
+
+    def set(self, key, embedding):
+        self.l1.set(key, embedding)
+        if self.l2 is not None:
+            try:
+                self.l2.set(key, embedding)
+            except Exception as e:
+                print(f"二级向量缓存写入失败：{e}")
+
+
+# =================================================
+# 根据配置创建缓存
+# url 为空：仅进程内缓存；redis:// 开头：Redis 二级缓存；其他：SQLite 文件路径
+# =================================================
+def build_embedding_cache(max_entries=10000, url=""):
+    l1 = LRUEmbeddingCache(max_entries=max_entries)
+    if not url:
+        return TieredEmbeddingCache(l1)
+    if url.startswith("redis://") or url.startswith("rediss://"):
+        return TieredEmbeddingCache(l1, RedisEmbeddingCache(url))
+    return TieredEmbeddingCache(l1, SQLiteEmbeddingCache(url))
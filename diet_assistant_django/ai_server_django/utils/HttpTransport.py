@@ -0,0 +1,185 @@
+"""
+HttpTransport 模块
+
+功能说明：
+- DashScope 请求按用途使用独立的 HTTP 连接池，突发请求复用已建立的 TLS 连接：
+  * chat：聊天（含流式 SSE）。流式回答会长时间占用连接，等待空闲连接的时间单独配置（默认较长）
+  * embedding：问题向量化。与聊天连接池分开，聊天流占满连接时不影响 RAG 检索
+  * 异步聊天客户端：每个事件循环一个连接池（上限默认 200，支持大量并发 SSE 连接）
+- 可配置（asst.env）：
+  * HTTP_CHAT_POOL_SIZE / HTTP_EMBEDDING_POOL_SIZE / HTTP_ASYNC_POOL_SIZE：各连接池大小，空闲连接全部保持存活
+  * HTTP_CHAT_POOL_TIMEOUT：聊天请求等待空闲连接的最长时间（秒，0 表示一直等待）
+  * HTTP_KEEPALIVE_EXPIRY：空闲连接保持时间（秒）
+  * HTTP_CONNECT_TIMEOUT / HTTP_READ_TIMEOUT：建连 / 读取超时（秒）
+  * HTTP_MAX_RETRIES：失败重试次数（OpenAI SDK 内置指数退避 + 随机抖动，
+    对连接错误、408/409/429/5xx 重试，并遵循 Retry-After）
+  * HTTP2：auto（默认，安装了 h2 时启用）/ 1 / 0
+- 连接复用统计：通过 httpcore trace 统计新建连接数，connection_stats() 返回请求数、新建连接数与复用率；
+  HTTP_METRICS_LOG_EVERY 条请求打印一次（0 表示不打印）
+"""
+
+import importlib.util
+import os
+import threading
+import httpx
+from dotenv import load_dotenv
+from openai import OpenAI, AsyncOpenAI
+
+
+# =================================================
+# 加载 .env 文件中的环境变量
+# =================================================
+load_dotenv('asst.env')
+chat_pool_size = int(os.getenv("HTTP_CHAT_POOL_SIZE", "64"))  # 同步聊天：不小于每个进程的并发工作线程数
+embedding_pool_size = int(os.getenv("HTTP_EMBEDDING_POOL_SIZE", "16"))
+async_pool_size = int(os.getenv("HTTP_ASYNC_POOL_SIZE", "200"))  # 异步聊天：每个事件循环的最大并发流式连接数
+chat_pool_timeout = float(os.getenv("HTTP_CHAT_POOL_TIMEOUT", "60")) or None
+keepalive_expiry = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+connect_timeout = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+read_timeout = float(os.getenv("HTTP_READ_TIMEOUT", "120"))  # 长回答流式生成期间两个数据块之间的最大间隔
+max_retries = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+http2_setting = os.getenv("HTTP2", "auto")
+metrics_log_every = int(os.getenv("HTTP_METRICS_LOG_EVERY", "200"))
+
+# HTTP/2 需要安装 h2（pip install httpx[http2]），未安装时使用 HTTP/1.1 keep-alive
+http2_enabled = (
+    importlib.util.find_spec("h2") is not None if http2_setting == "auto" else http2_setting == "1"
+)
+
+
+# =================================================
+# ConnectionMetrics：连接复用统计
+# =================================================
+class ConnectionMetrics:
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self._lock = threading.Lock()
+
+    def on_request(self):
+        with self._lock:
+            self.requests += 1
+            should_log = metrics_log_every and self.requests % metrics_log_every == 0
+        if should_log:
+            print(f"🔌 DashScope 连接统计: {self.stats()}")
+
+    def on_trace(self, event_name, info):
+        # 每次 TCP 建连（随后进行 TLS 握手）计为一次新连接
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self.new_connections += 1
+
+    async def on_trace_async(self, event_name, info):
+        self.on_trace(event_name, info)
+
+    def stats(self):
+        with self._lock:
+            requests, new_connections = self.requests, self.new_connections
+        reused = max(requests - new_connections, 0)
+        return {
+            "requests": requests,
+            "new_connections": new_connections,
+            "reused": reused,
+            "reuse_rate": round(reused / requests, 4) if requests else 0.0,
+            "http2": http2_enabled,
+        }
+
+
+metrics = ConnectionMetrics()
+
+
+def connection_stats():
+    return metrics.stats()
+
+
+# =================================================
+# 连接池配置
+# =================================================
+# 各用途的连接池大小与等待空闲连接的超时（秒）
+# 向量化请求很短：连接池满时快速失败，由 SDK 重试
+POOLS = {
+    "chat": (chat_pool_size, chat_pool_timeout),
+    "embedding": (embedding_pool_size, connect_timeout),
+    "async_chat": (async_pool_size, chat_pool_timeout),
+}
+
+
+def _limits(purpose):
+    size = POOLS[purpose][0]
+    return httpx.Limits(
+        max_connections=size,
+        max_keepalive_connections=size,  # 空闲连接全部保留，突发请求无需重新握手
+        keepalive_expiry=keepalive_expiry,
+    )
+
+
+def _timeout(purpose):
+    return httpx.Timeout(connect=connect_timeout, read=read_timeout, write=30.0, pool=POOLS[purpose][1])
+
+
+def _on_request(request):
+    request.extensions["trace"] = metrics.on_trace
+    metrics.on_request()
+
+
+async def _on_request_async(request):
+    request.extensions["trace"] = metrics.on_trace_async
+    metrics.on_request()
+
+
+# =================================================
+# 共享客户端（线程安全的懒加载单例）
+# =================================================
+_lock = threading.Lock()
+_http_clients = {}
+_openai_clients = {}
+
+
+def get_http_client(purpose="chat"):
+    """进程内共享的同步 httpx 客户端（每种用途一个连接池：chat / embedding）"""
+    with _lock:
+        client = _http_clients.get(purpose)
+        if client is None:
+            client = _http_clients[purpose] = httpx.Client(
+                limits=_limits(purpose),
+                timeout=_timeout(purpose),
+                http2=http2_enabled,
+                event_hooks={"request": [_on_request]},
+            )
+        return client
+
+
+def get_openai_client(api_key, base_url, purpose="chat"):
+    """共享连接池的 OpenAI 客户端（相同用途、密钥和地址只创建一个）"""
+    key = (purpose, api_key, base_url)
+    client = _openai_clients.get(key)
+    if client is None:
+        http_client = get_http_client(purpose)
+        with _lock:
+            client = _openai_clients.get(key)
+            if client is None:
+                client = OpenAI(
+                    api_key=api_key,
+                    base_url=base_url,
+                    http_client=http_client,
+                    timeout=_timeout(purpose),
+                    max_retries=max_retries,
+                )
+                _openai_clients[key] = client
+    return client
+
+
+def build_async_openai_client(api_key, base_url):
+    """异步 OpenAI 客户端（连接池与事件循环绑定，由调用方按事件循环缓存）"""
+    return AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        http_client=httpx.AsyncClient(
+            limits=_limits("async_chat"),
+            timeout=_timeout("async_chat"),
+            http2=http2_enabled,
+            event_hooks={"request": [_on_request_async]},
+        ),
+        timeout=_timeout("async_chat"),
+        max_retries=max_retries,
+    )
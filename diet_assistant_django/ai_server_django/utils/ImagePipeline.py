@@ -0,0 +1,139 @@
+"""
+ImagePipeline 模块
+
+功能说明：
+- 上传图片的预处理：按视觉模型合适的分辨率等比缩小（最长边 max_side），统一转为 JPEG 重新压缩，
+  压缩版本以 文件内容哈希 命名保存到 variant_dir（同一张图片只处理一次）
+- 缓存 data URI：视觉对话直接使用内存中已编码好的 base64 data URI，
+  不再每轮读取原图并重新编码，请求体也从数 MB 降到几百 KB
+- 未安装 Pillow 或图片无法解析时退化为直接编码原图（与原有行为一致）
+"""
+
+import base64
+import hashlib
+import mimetypes
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+try:
+    from PIL import Image, ImageOps  # 可选依赖：图片缩放与重新编码
+except ImportError:
+    Image = None
+
+
+# =================================================
+# 文件内容哈希（SHA-256）
+# =================================================
+def file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+# =================================================
+# ImagePipeline：图片压缩 + data URI 缓存
+# 对外提供 prepare / data_uri 方法
+# =================================================
+class ImagePipeline:
+    def __init__(self, variant_dir, max_side=1024, quality=85, cache_size=128):
+        """
+        Args:
+            variant_dir (str | Path): 压缩版本的保存目录
+            max_side (int): 压缩后图片最长边（像素）
+            quality (int): JPEG 压缩质量
+            cache_size (int): 内存中缓存的 data URI 个数（LRU 淘汰）
+        """
+        self.variant_dir = Path(variant_dir)
+        self.max_side = max_side
+        self.quality = quality
+        self.cache_size = cache_size
+        self._digests = OrderedDict()  # 原图路径 -> 内容哈希（避免重复读取原图计算哈希）
+        self._uris = OrderedDict()  # 内容哈希 -> data URI
+        self._lock = threading.Lock()
+
+    def _remember(self, cache, key, value):
+        with self._lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+
+    def _lookup(self, cache, key):
+        with self._lock:
+            value = cache.get(key)
+            if value is not None:
+                cache.move_to_end(key)
+            return value
+
+    # =================================================
+    # 生成压缩版本（上传时调用，重复调用直接返回已有结果）
+    # =================================================
+    def prepare(self, path, digest=None):
+        """
+        Args:
+            path (str | Path): 原图路径
+            digest (str | None): 原图内容哈希（已知时传入，避免重复计算）
+        Returns:
+            Tuple[str, Path | None]: (内容哈希, 压缩版本路径；无法压缩时为 None)
+        """
+        path = str(path)
+        digest = digest or self._lookup(self._digests, path) or file_sha256(path)
+        self._remember(self._digests, path, digest)
+
+        variant = self.variant_dir / f"{digest}.jpg"
+        if variant.exists():
+            return digest, variant
+        if Image is None:
+            return digest, None
+
+        try:
+            with Image.open(path) as image:
+                image = ImageOps.exif_transpose(image)  # 按 EXIF 方向旋转（手机照片）
+                if image.mode in ("RGBA", "LA", "P"):
+                    # 透明背景填充为白色，JPEG 不支持透明通道
+                    image = image.convert("RGBA")
+                    background = Image.new("RGB", image.size, (255, 255, 255))
+                    background.paste(image, mask=image.getchannel("A"))
+                    image = background
+                else:
+                    image = image.convert("RGB")
+                image.thumbnail((self.max_side, self.max_side), Image.LANCZOS)
+
+                self.variant_dir.mkdir(parents=True, exist_ok=True)
+                # 先写临时文件再原子替换：并发处理同一张图片时互不干扰
+                tmp_path = variant.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+                image.save(tmp_path, "JPEG", quality=self.quality, optimize=True)
+                os.replace(tmp_path, variant)
+        except Exception as e:
+            print(f"图片压缩失败（使用原图）: {path}: {e}")
+            return digest, None
+        return digest, variant
+
+    # =================================================
+    # 获取图片的 data URI（优先使用压缩版本）
+    # =================================================
+    def data_uri(self, path, digest=None):
+        """
+        Args:
+            path (str | Path): 原图路径
+            digest (str | None): 原图内容哈希（已知时传入）
+        Returns:
+            str: data:image/...;base64,... 格式的图片数据
+        """
+        digest = digest or self._lookup(self._digests, str(path))
+        if digest is not None:
+            uri = self._lookup(self._uris, digest)
+            if uri is not None:
+                return uri
+
+        digest, variant = self.prepare(path, digest)
+        source = variant or path
+        mime = "image/jpeg" if variant else (mimetypes.guess_type(str(path))[0] or "image/jpeg")
+        with open(source, "rb") as f:
+            uri = f"data:{mime};base64,{base64.b64encode(f.read()).decode('utf-8')}"
+        self._remember(self._uris, digest, uri)
+        return uri
@@ -0,0 +1,29 @@
+"""
+LatencyStats 模块
+
+功能说明：
+- 延迟分位数统计：把延迟样本（秒）汇总为 p50 / p95（毫秒）
+- 供模型路由统计（diet_asst.routing）、数据库查询压测命令和 性能测试_*.py 脚本共用，各处的分位数口径保持一致
+"""
+
+import statistics
+
+
+# =================================================
+# p50 / p95（毫秒）
+# =================================================
+def percentiles(samples, ndigits=1):
+    """
+    Args:
+        samples (Iterable[float]): 延迟样本（秒）
+        ndigits (int): 结果保留的小数位数
+    Returns:
+        dict: {"p50": 毫秒, "p95": 毫秒}（没有样本时均为 0.0）
+    """
+    samples = sorted(samples)
+    if not samples:
+        return {"p50": 0.0, "p95": 0.0}
+    return {
+        "p50": round(statistics.median(samples) * 1000, ndigits),
+        "p95": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, ndigits),
+    }
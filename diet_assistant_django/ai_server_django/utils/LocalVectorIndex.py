@@ -0,0 +1,123 @@
+"""
+LocalVectorIndex 模块
+
+功能说明：
+- 进程内向量索引：知识库向量以 NumPy 矩阵（.npy，内存映射加载）保存，
+  检索时在 Django 进程内做 top-k 余弦相似度计算，无需 Chroma HTTP 服务
+- 索引文件从已导入的 Chroma 集合导出（复用已有向量，不重新调用 Embedding API）
+- query 方法的参数与返回格式与 Chroma collection.query 一致，可直接替换
+
+索引目录结构：
+- embeddings.npy：float32 矩阵（每行一个已归一化的文档向量）
+- chunks.jsonl：与矩阵行一一对应的 {"id", "document", "metadata"}
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+
+
+# =================================================
+# LocalVectorIndex：进程内 top-k 余弦检索
+# 对外提供 query / count 方法
+# =================================================
+class LocalVectorIndex:
+    def __init__(self, index_dir="./vector_index"):
+        index_path = Path(index_dir)
+        # 内存映射加载：多个进程共享同一份页缓存，启动时不整体读入内存
+        self.embeddings = np.load(index_path / "embeddings.npy", mmap_mode="r")
+        self.ids, self.documents, self.metadatas = [], [], []
+        with open(index_path / "chunks.jsonl", "r", encoding="utf-8") as f:
+            for line in f:
+                chunk = json.loads(line)
+                self.ids.append(chunk["id"])
+                self.documents.append(chunk["document"])
+                self.metadatas.append(chunk["metadata"])
+        print(f"✅ 加载本地向量索引: {len(self.ids)} 个知识块")
+
+    def count(self):
+        return len(self.ids)
+
+    # =================================================
+    # top-k 检索（返回格式与 Chroma collection.query 一致）
+    # =================================================
+    def query(self, query_embeddings, n_results=10):
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        k = min(n_results, len(self.ids))
+        for embedding in query_embeddings:
+            if not k:
+                # 空索引（导出时为 0x0 矩阵）或 n_results 为 0：不做矩阵运算，直接返回空结果
+                for key in result:
+                    result[key].append([])
+                continue
+            query = np.asarray(embedding, dtype=np.float32)
+            norm = np.linalg.norm(query)
+            if norm:
+                query = query / norm
+            # 文档向量已归一化：点积即余弦相似度
+            similarities = self.embeddings @ query
+            # argpartition 取前 k 个（O(n)），再对这 k 个排序
+            top = np.argpartition(-similarities, k - 1)[:k]
+            top = top[np.argsort(-similarities[top])]
+            result["ids"].append([self.ids[i] for i in top])
+            result["documents"].append([self.documents[i] for i in top])
+            result["metadatas"].append([self.metadatas[i] for i in top])
+            result["distances"].append([float(1 - similarities[i]) for i in top])
+        return result
+
+
+# =================================================
+# 从 Chroma 集合导出本地索引文件
+# =================================================
+def export_from_collection(collection, index_dir="./vector_index", batch_size=500):
+    """
+    分页读取 Chroma 集合中的向量、文档和元数据，写入本地索引目录
+
+    Args:
+        collection: Chroma 集合
+        index_dir (str): 索引输出目录
+        batch_size (int): 每次从 Chroma 读取的条数
+    """
+    index_path = Path(index_dir)
+    index_path.mkdir(parents=True, exist_ok=True)
+
+    vectors = []
+    with open(index_path / "chunks.jsonl", "w", encoding="utf-8") as f:
+        offset = 0
+        while True:
+            page = collection.get(
+                include=["embeddings", "documents", "metadatas"],
+                limit=batch_size,
+                offset=offset,
+            )
+            if not page["ids"]:
+                break
+            for i, chunk_id in enumerate(page["ids"]):
+                f.write(json.dumps({
+                    "id": chunk_id,
+                    "document": page["documents"][i],
+                    "metadata": page["metadatas"][i],
+                }, ensure_ascii=False) + "\n")
+                vectors.append(np.asarray(page["embeddings"][i], dtype=np.float32))
+            offset += len(page["ids"])
+
+    # 归一化后保存，检索时点积即余弦相似度
+    matrix = np.vstack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True) if len(matrix) else 1
+    matrix = matrix / np.where(norms == 0, 1, norms)
+    np.save(index_path / "embeddings.npy", matrix.astype(np.float32))
+    print(f"💾 本地向量索引已导出: {len(vectors)} 个知识块 → {index_dir}")
+
+
+if __name__ == "__main__":
+    """
+    使用示例：先用 数据处理_添加到VDB.py 导入 Chroma，再导出本地索引
+    之后在 asst.env 中设置 VECTOR_BACKEND=local 即可切换到本地检索
+    """
+    import chromadb
+    chroma_client = chromadb.HttpClient(host="localhost", port=8081)
+    export_from_collection(
+        chroma_client.get_collection(name="my_collection"),
+        index_dir="./vector_index",
+    )
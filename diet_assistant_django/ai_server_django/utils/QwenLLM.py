@@ -1,6 +1,8 @@
 import os
+import asyncio
+import weakref
 import dotenv
-from openai import OpenAI
+from utils.HttpTransport import get_openai_client, build_async_openai_client
 
 
 class QwenLLM:
@@ -8,10 +10,8 @@ class QwenLLM:
         dotenv.load_dotenv('asst.env')
         self.api_key = os.getenv('OPENAI_API_KEY')
         self.api_base_url = os.getenv('API_BASE_URL')
-        self.client = OpenAI(
-            api_key=self.api_key,
-            base_url=self.api_base_url
-        )
+        # 共享连接池的客户端（连接池大小、超时、重试见 HttpTransport）
+        self.client = get_openai_client(self.api_key, self.api_base_url)
 
     def inference(self,
                   messages=None,
@@ -21,6 +21,7 @@ class QwenLLM:
                   stream=False,
                   max_tokens=2048,
                   temperature=0.7,
+                  include_usage=False,
                   ):
         if messages is None:
             messages = []
@@ -37,6 +38,82 @@ class QwenLLM:
                 # 控制参数
                 max_tokens=max_tokens,
                 temperature=temperature,
+                # 流式返回时在最后一个数据块附带 token 用量（用于分路由统计）
+                **({"stream_options": {"include_usage": True}} if stream and include_usage else {}),
+            )
+            if not stream:
+                answer = completion.choices[0].message.content
+            else:
+                return completion
+        except Exception as e:
+            answer = f"错误! {e}"
+            print(f"错误信息：{e}")
+        return answer
+
+    def inference_text(self, **kwargs):
+        """
+        非流式调用，只返回可用的回答文本
+
+        Returns:
+            str | None: 去掉首尾空白的回答；调用失败（inference 返回 "错误! ..."）或回答为空时返回 None
+        """
+        answer = self.inference(**kwargs)
+        if not answer or answer.startswith("错误!"):
+            return None
+        return answer.strip()
+
+
+class AsyncQwenLLM:
+    """
+    QwenLLM 的异步版本（供 ASGI 异步视图使用）
+
+    - 基于 AsyncOpenAI 客户端，流式生成时不占用工作线程
+    - 同一事件循环内的所有请求共享一个 HTTP 连接池（httpx.AsyncClient），
+      避免每个请求重复建立 TLS 连接（连接池大小、超时、重试与同步客户端一致，见 HttpTransport）
+    """
+
+    def __init__(self):
+        dotenv.load_dotenv('asst.env')
+        self.api_key = os.getenv('OPENAI_API_KEY')
+        self.api_base_url = os.getenv('API_BASE_URL')
+        # 连接池与事件循环绑定：每个事件循环一个客户端（事件循环关闭后自动回收）
+        self._clients = weakref.WeakKeyDictionary()
+
+    def _get_client(self):
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = build_async_openai_client(self.api_key, self.api_base_url)
+            self._clients[loop] = client
+        return client
+
+    async def inference(self,
+                        messages=None,
+                        model="qwen-plus",
+                        enable_search=False,
+                        enable_thinking=False,
+                        stream=False,
+                        max_tokens=2048,
+                        temperature=0.7,
+                        include_usage=False,
+                        ):
+        if messages is None:
+            messages = []
+        try:
+            completion = await self._get_client().chat.completions.create(
+                model=model,
+                messages=messages,
+                stream=stream,  # 是否流式返回
+                # 扩展配置
+                extra_body={
+                    "enable_search": enable_search,  # 联网搜索
+                    "enable_thinking": enable_thinking,  # 深度思考
+                },
+                # 控制参数
+                max_tokens=max_tokens,
+                temperature=temperature,
+                # 流式返回时在最后一个数据块附带 token 用量（用于分路由统计）
+                **({"stream_options": {"include_usage": True}} if stream and include_usage else {}),
             )
             if not stream:
                 answer = completion.choices[0].message.content
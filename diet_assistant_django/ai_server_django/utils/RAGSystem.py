@@ -3,16 +3,35 @@ RAGSystem 模块
 
 功能说明：
 - 基于 Chroma 向量数据库实现文档检索
-- 使用 DashScope(OpenAI-compatible) Embedding API 进行向量召回
+- 可选本地检索模式（VECTOR_BACKEND=local）：在进程内加载内存映射的向量矩阵做 top-k 检索，
+  省去访问 Chroma HTTP 服务的网络开销
+- 使用 DashScope(OpenAI-compatible) Embedding API 进行向量召回（与聊天共享 HttpTransport 连接池）
+- 可选混合检索（BM25_INDEX_PATH）：jieba 分词 BM25 词法召回 + 向量召回，
+  通过倒数排名融合（RRF）合并，缩小送入重排序的候选集合
+- 问题向量经缓存层（进程内 LRU + 可选 SQLite/Redis）计算，重复问题不再调用 Embedding API
 - 使用本地 CrossEncoder（二次精排模型）对召回结果进行重排序（弃用）
 - 使用 FlagEmbedding 官方 BGE 模型重排序器（性能优化）
+- 重排序针对 CPU 优化：可配置精度、线程数、最大序列长度、批大小，
+  并缓存 (问题, 文档id) → 得分，重复问题不再经过交叉编码器
+- 重排序微批调度：并发请求的文档对在几毫秒窗口内合并为一个大批次计算，
+  再把得分分发回各请求，提升并发场景下单核吞吐
 - 返回与用户问题最相关的文档片段，供上层 LLM 使用
 """
 
 import chromadb
+import hashlib
 import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
 from dotenv import load_dotenv
 from chromadb.utils.embedding_functions import OpenAIEmbeddingFunction
+from utils.EmbeddingCache import build_embedding_cache, make_key
+from utils.LocalVectorIndex import LocalVectorIndex
+from utils.BM25Index import BM25Index
+from utils.HttpTransport import get_openai_client
 # from sentence_transformers import CrossEncoder  # 弃用
 from FlagEmbedding import FlagReranker  # BGE模型官方重排序器（性能优化）
 
@@ -24,6 +43,184 @@ load_dotenv('asst.env')
 openai_api_key = os.getenv("OPENAI_API_KEY")
 api_base_url = os.getenv("API_BASE_URL")
 rerank_model = os.getenv("RERANK_MODEL")
+embedding_model = "text-embedding-v4"
+# 向量检索后端：chroma（Chroma HTTP 服务）或 local（进程内本地索引）
+vector_backend = os.getenv("VECTOR_BACKEND", "chroma")
+local_index_dir = os.getenv("LOCAL_INDEX_DIR", "./vector_index")
+# 混合检索配置：BM25 索引文件路径（留空则只用向量召回）+ 融合后送入重排序的候选数
+bm25_index_path = os.getenv("BM25_INDEX_PATH", "")
+hybrid_candidates = int(os.getenv("HYBRID_CANDIDATES", "15"))
+# 问题向量缓存配置：进程内缓存条数 + 二级缓存地址（SQLite 文件路径或 redis:// 地址，留空则不启用）
+embedding_cache_size = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+embedding_cache_url = os.getenv("EMBEDDING_CACHE_URL", "")
+# 重排序配置（默认面向纯 CPU 部署：FP32、torch 默认线程数、512 最大长度）
+rerank_use_fp16 = os.getenv("RERANK_FP16", "0") == "1"  # FP16 仅在 GPU 上有加速效果
+rerank_threads = int(os.getenv("RERANK_THREADS", "0"))  # 推理线程数，0 表示使用 torch 默认值
+rerank_max_length = int(os.getenv("RERANK_MAX_LENGTH", "512"))  # 问题+文档的最大 token 数
+rerank_batch_size = int(os.getenv("RERANK_BATCH_SIZE", "32"))  # 每批计算的文档对数
+rerank_cache_size = int(os.getenv("RERANK_CACHE_SIZE", "50000"))  # 得分缓存条数，0 表示不缓存
+rerank_batch_window_ms = float(os.getenv("RERANK_BATCH_WINDOW_MS", "5"))  # 微批收集窗口（毫秒），0 表示不合并
+rerank_max_batch_pairs = int(os.getenv("RERANK_MAX_BATCH_PAIRS", "128"))  # 单个合并批次的最大文档对数
+
+# =================================================
+# 倒数排名融合（RRF）：多路召回结果按排名合并
+# score(d) = Σ 1 / (k + rank_i(d))，k 越大排名靠后的文档影响越平滑
+# =================================================
+def reciprocal_rank_fusion(rankings, k=60):
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+# =================================================
+# RerankBatcher：重排序微批调度器
+# 在收集窗口内合并多个请求的文档对，一次计算后按请求拆分得分
+# =================================================
+class RerankBatcher:
+    def __init__(self, compute_fn, window_ms=5, max_batch_pairs=128):
+        """
+        Args:
+            compute_fn (Callable): 批量计算函数，输入文档对列表，返回等长得分列表
+            window_ms (float): 收集窗口（毫秒），首个请求到达后最多等待这么久
+            max_batch_pairs (int): 单个合并批次的最大文档对数，达到后立即计算
+        """
+        self.compute_fn = compute_fn
+        self.window = window_ms / 1000
+        self.max_batch_pairs = max_batch_pairs
+        self._queue = queue.Queue()
+        # 后台调度线程：串行执行合并后的批次，避免多线程争抢 CPU 核心
+        self._thread = threading.Thread(target=self._run, name="rerank-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, pairs):
+        """提交文档对并阻塞等待得分"""
+        future = Future()
+        self._queue.put((pairs, future))
+        return future.result()
+
+    def _collect(self):
+        # 阻塞等待第一个请求，然后在窗口内继续收集
+        batch = [self._queue.get()]
+        total = len(batch[0][0])
+        deadline = time.monotonic() + self.window
+        while total < self.max_batch_pairs:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            total += len(item[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            all_pairs = [pair for pairs, _ in batch for pair in pairs]
+            try:
+                scores = self.compute_fn(all_pairs)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            # 按提交顺序拆分得分，分发回各请求
+            offset = 0
+            for pairs, future in batch:
+                future.set_result(scores[offset:offset + len(pairs)])
+                offset += len(pairs)
+
+# =================================================
+# CachedReranker：BGE 重排序器（CPU 优化 + 得分缓存）
+# 对外提供 scores 方法
+# =================================================
+class CachedReranker:
+    def __init__(
+        self,
+        model_path=rerank_model,  # 本地二次精排模型路径
+        use_fp16=rerank_use_fp16,  # 是否使用 FP16 精度
+        num_threads=rerank_threads,  # 推理线程数
+        max_length=rerank_max_length,  # 最大序列长度（超出截断）
+        batch_size=rerank_batch_size,  # 批大小
+        score_cache_size=rerank_cache_size,  # 得分缓存条数
+        batch_window_ms=rerank_batch_window_ms,  # 微批收集窗口（毫秒），0 表示不合并
+        max_batch_pairs=rerank_max_batch_pairs,  # 单个合并批次的最大文档对数
+    ):
+        # CPU 推理线程数：避免多个请求的推理线程争抢同一批核心
+        if num_threads > 0:
+            import torch
+            torch.set_num_threads(num_threads)
+
+        self.model = FlagReranker(
+            model_path,
+            use_fp16=use_fp16  # FP16精度仅在 GPU 上加速，CPU 部署保持 FP32
+        )
+        self.max_length = max_length
+        self.batch_size = batch_size
+
+        # 得分缓存：(问题哈希, 文档id) -> 得分，LRU 淘汰
+        self.score_cache_size = score_cache_size
+        self._score_cache = OrderedDict()
+        self._score_lock = threading.Lock()
+
+        # 微批调度：并发请求共享一个批次
+        self.batcher = RerankBatcher(
+            self._compute_batch,
+            window_ms=batch_window_ms,
+            max_batch_pairs=max_batch_pairs,
+        ) if batch_window_ms > 0 else None
+
+    # =================================================
+    # 批量计算文档对得分（不经过缓存）
+    # =================================================
+    def compute(self, pairs):
+        if self.batcher is not None:
+            return self.batcher.submit(pairs)
+        return self._compute_batch(pairs)
+
+    def _compute_batch(self, pairs):
+        scores = self.model.compute_score(
+            pairs,
+            batch_size=self.batch_size,
+            max_length=self.max_length,
+        )
+        # 只有一对时 FlagReranker 返回单个数值
+        if not isinstance(scores, list):
+            scores = [scores]
+        return [float(score) for score in scores]
+
+    # =================================================
+    # 计算问题与候选文档的相关性得分（命中缓存的文档对不再计算）
+    # =================================================
+    def scores(self, question, ids, documents):
+        question_hash = hashlib.md5(question.strip().encode('utf-8')).hexdigest()
+        keys = [(question_hash, doc_id) for doc_id in ids]
+
+        # 查缓存
+        scores = [None] * len(documents)
+        with self._score_lock:
+            for i, key in enumerate(keys):
+                score = self._score_cache.get(key)
+                if score is not None:
+                    self._score_cache.move_to_end(key)
+                    scores[i] = score
+
+        # 只计算未命中的文档对
+        missing = [i for i, score in enumerate(scores) if score is None]
+        if missing:
+            new_scores = self.compute([(question, documents[i]) for i in missing])
+            with self._score_lock:
+                for i, score in zip(missing, new_scores):
+                    scores[i] = score
+                    if self.score_cache_size > 0:
+                        self._score_cache[keys[i]] = score
+                while len(self._score_cache) > self.score_cache_size:
+                    self._score_cache.popitem(last=False)
+        return scores
+
 
 # =================================================
 # RAGSystem：负责向量召回 + 二次精排
@@ -36,28 +233,99 @@ class RAGSystem:
         port=8081,
         collection_name="my_collection",  # 向量集合名称
         rerank_model_path=rerank_model,  # 本地二次精排模型路径
+        embedding_cache=None,  # 问题向量缓存（需提供 get/set 方法），默认按环境变量创建
+        backend=vector_backend,  # 向量检索后端：chroma / local
+        index_dir=local_index_dir,  # 本地索引目录（backend=local 时使用）
+        bm25_path=bm25_index_path,  # BM25 索引文件路径（留空则不启用混合检索）
+        use_fp16=rerank_use_fp16,  # 重排序是否使用 FP16 精度
+        num_threads=rerank_threads,  # 重排序推理线程数
+        max_length=rerank_max_length,  # 重排序最大序列长度（超出截断）
+        batch_size=rerank_batch_size,  # 重排序批大小
+        score_cache_size=rerank_cache_size,  # 重排序得分缓存条数
     ):
-        # 初始化 Chroma 客户端
-        chroma_client = chromadb.HttpClient(host=host, port=port)
-
-        # 获取 / 创建向量集合
-        self.collection = chroma_client.get_or_create_collection(
-            name=collection_name,
-            embedding_function=OpenAIEmbeddingFunction(
-                api_key=openai_api_key,
-                model_name="text-embedding-v4",
-                api_base=api_base_url,
-                api_type="dashscope",
-            ),
+        # 向量化函数：DashScope text-embedding-v4
+        self.embedding_function = OpenAIEmbeddingFunction(
+            api_key=openai_api_key,
+            model_name=embedding_model,
+            api_base=api_base_url,
+            api_type="dashscope",
+        )
+        # 问题向量化使用独立的 embedding 连接池，不与聊天流式连接争用
+        # （集合上的 embedding_function 仅用于按文本查询时的兼容）
+        self.embedding_client = get_openai_client(openai_api_key, api_base_url, purpose="embedding")
+
+        # 问题向量缓存
+        self.embedding_cache = embedding_cache or build_embedding_cache(
+            max_entries=embedding_cache_size,
+            url=embedding_cache_url,
         )
 
+        if backend == "local":
+            # 本地索引：query 接口与 Chroma 集合一致
+            self.collection = LocalVectorIndex(index_dir)
+        else:
+            # 初始化 Chroma 客户端
+            chroma_client = chromadb.HttpClient(host=host, port=port)
+
+            # 获取 / 创建向量集合
+            self.collection = chroma_client.get_or_create_collection(
+                name=collection_name,
+                embedding_function=self.embedding_function,
+            )
+
+        # 加载 BM25 词法索引（混合检索）
+        self.bm25 = BM25Index.load(bm25_path) if bm25_path else None
+
         # # 加载本地 CrossEncoder 二次精排模型
         # self.model = CrossEncoder(rerank_model_path)  # 弃用
 
-        # 加载 FlagEmbedding 官方 BGE 模型重排序器
-        self.model = FlagReranker(
+        # 加载 FlagEmbedding 官方 BGE 模型重排序器（CPU 优化 + 得分缓存）
+        self.reranker = CachedReranker(
             rerank_model_path,
-            use_fp16=True  # 启用FP16精度 (GPU加速，提升推理速度）
+            use_fp16=use_fp16,
+            num_threads=num_threads,
+            max_length=max_length,
+            batch_size=batch_size,
+            score_cache_size=score_cache_size,
+        )
+        self.model = self.reranker.model
+
+    # =================================================
+    # 计算用户问题的向量（供检索和语义缓存复用）
+    # 先查缓存，未命中才调用 Embedding API
+    # =================================================
+    def embed_query(self, question):
+        key = make_key(question, embedding_model)
+        embedding = self.embedding_cache.get(key)
+        if embedding is None:
+            response = self.embedding_client.embeddings.create(
+                model=embedding_model,
+                input=[question],
+                encoding_format="float",
+            )
+            embedding = [float(x) for x in response.data[0].embedding]
+            self.embedding_cache.set(key, embedding)
+        return embedding
+
+    # =================================================
+    # 融合向量召回与 BM25 召回结果（RRF），返回前 candidates 个候选
+    # =================================================
+    def hybrid_fuse(self, question, ids, documents, metadatas, n_results, candidates):
+        lexical = self.bm25.query(question, n_results=n_results)
+
+        # 文档 id -> (内容, 元数据)：向量召回结果 + BM25 召回结果
+        pool = {doc_id: (documents[i], metadatas[i]) for i, doc_id in enumerate(ids)}
+        lexical_ids = []
+        for doc_index in lexical:
+            doc_id = self.bm25.ids[doc_index]
+            lexical_ids.append(doc_id)
+            pool.setdefault(doc_id, (self.bm25.documents[doc_index], self.bm25.metadatas[doc_index]))
+
+        fused = reciprocal_rank_fusion([ids, lexical_ids])[:candidates]
+        return (
+            fused,
+            [pool[doc_id][0] for doc_id in fused],
+            [pool[doc_id][1] for doc_id in fused],
         )
 
     # =================================================
@@ -70,29 +338,37 @@ class RAGSystem:
         rerank=True,  # 是否启用二次精排
         rank_threshold=0.2,  # 精排得分阈值
         top_k=5,  # 最终返回的文档片段数量
+        query_embedding=None,  # 已计算好的问题向量（可选，避免重复调用Embedding API）
+        candidates=hybrid_candidates,  # 混合检索融合后送入重排序的候选数
     ):
 
-        # 向量召回
+        # 向量召回：直接传入问题向量，Chroma 不再调用 Embedding API
+        if query_embedding is None:
+            query_embedding = self.embed_query(question)
         result = self.collection.query(
-            query_texts=[question],
+            query_embeddings=[query_embedding],
             n_results=n_results
         )
 
-        # 提取文档内容和元数据（ChromaDB返回格式：列表的列表）
+        # 提取文档id、内容和元数据（ChromaDB返回格式：列表的列表）
+        ids = result["ids"][0]
         documents = result["documents"][0]
         metadatas = result["metadatas"][0]
 
+        # 混合检索：BM25 词法召回与向量召回融合，缩小候选集合
+        if self.bm25 is not None:
+            ids, documents, metadatas = self.hybrid_fuse(
+                question, ids, documents, metadatas, n_results, candidates
+            )
+
         # ----------------------------------------
         # 重排序逻辑
         # ----------------------------------------
         if rerank and documents:
             print(f"🔍 初始检索结果: {len(documents)} 个候选文档")
 
-            # 构造输入对，批量计算得分，提升效率
-            pairs = [(question, doc) for doc in documents]
-
-            # 使用BGE模型批量计算相关性分数
-            scores = self.model.compute_score(pairs)
+            # 使用BGE模型批量计算相关性分数（带得分缓存）
+            scores = self.reranker.scores(question, ids, documents)
 
             # 将分数与文档、元数据组合并排序
             combined = []
@@ -107,22 +383,25 @@ class RAGSystem:
             combined.sort(key=lambda x: x["score"], reverse=True)
 
             # 过滤并截取top_k个文档
-            chunks, metas = [], []
+            chunks, metas, kept_scores = [], [], []
             for item in combined:
                 # 得分过低或数量达到上限即停止
                 if item["score"] < rank_threshold or len(chunks) >= top_k:
                      break
                 chunks.append(item["doc"])
                 metas.append(item["meta"])
+                kept_scores.append(item["score"])
 
             return {
                 "documents": chunks,
                 "metadatas": metas,
+                "scores": kept_scores,  # 与 documents 一一对应的重排序得分（降序），供模型路由判断检索置信度
             }
 
         # 未启用重排序或无结果
         return {
             "documents": documents[:top_k],
             "metadatas": metadatas[:top_k],
+            "scores": [],
         }
 
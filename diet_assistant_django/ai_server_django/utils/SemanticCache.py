@@ -0,0 +1,173 @@
+"""
+SemanticCache 模块
+
+功能说明：
+- 以用户问题的向量为键缓存模型回答（语义相近的问题直接复用回答）
+- 命名空间隔离：模型、联网/深度思考开关、RAG参考资料哈希不同的回答互不复用
+- 相似度阈值：余弦相似度达到阈值才算命中
+- 过期时间（TTL）+ LRU 淘汰：控制缓存的新鲜度和内存占用
+- 统计命中/未命中次数，便于评估缓存效果
+- 向量化查找：每个命名空间的缓存向量堆叠为一个矩阵（写入后按需重建），一次矩阵乘法算出全部相似度；
+  锁只用于读取快照和更新 LRU，相似度计算在锁外进行，并发请求不会互相排队
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+# =================================================
+# SemanticCache：语义回答缓存（进程内）
+# 对外提供 make_namespace / lookup / store / stats 方法
+# =================================================
+class SemanticCache:
+    def __init__(
+        self,
+        threshold=0.95,  # 命中所需的最小余弦相似度
+        ttl=3600,  # 缓存有效期（秒）
+        max_entries=2000,  # 最大缓存条数，超出后淘汰最久未使用的条目
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        # 缓存条目：entry_id -> (分组键, 归一化向量, 回答, 写入时间)
+        # OrderedDict 的顺序即 LRU 顺序（末尾为最近使用）
+        self._entries = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        # 按 (命名空间, 向量维度) 分组：分组键 -> {entry_id: (归一化向量, 写入时间)}
+        self._groups = {}
+        # 分组版本号（写入/删除时递增）与对应的矩阵快照：分组键 -> (版本号, id 数组, 向量矩阵, 写入时间数组)
+        self._versions = {}
+        self._matrices = {}
+
+        # 命中统计
+        self.hits = 0
+        self.misses = 0
+
+    # =================================================
+    # 生成命名空间：只有命名空间相同的回答才能互相复用
+    # =================================================
+    @staticmethod
+    def make_namespace(model, enable_search, enable_thinking, context):
+        context_hash = hashlib.md5(context.encode('utf-8')).hexdigest()
+        return f"{model}|{int(enable_search)}|{int(enable_thinking)}|{context_hash}"
+
+    @staticmethod
+    def _normalize(embedding):
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    # =================================================
+    # 查找语义相近的缓存回答
+    # =================================================
+    def lookup(self, embedding, namespace):
+        """
+        Args:
+            embedding (List[float]): 用户问题向量
+            namespace (str): make_namespace 生成的命名空间
+        Returns:
+            str | None: 命中时返回缓存的回答，否则返回 None
+        """
+        query = self._normalize(embedding)
+        key = (namespace, query.shape[0])
+        now = time.time()
+
+        # 1. 锁内只取快照：分组未变化时直接复用已堆叠的矩阵
+        with self._lock:
+            snapshot = self._matrices.get(key)
+            version = self._versions.get(key)
+            rows = None
+            if version is not None and (snapshot is None or snapshot[0] != version):
+                rows = list(self._groups[key].items())
+        if version is None:
+            return self._record(None)
+
+        # 2. 锁外重建矩阵（写入后的首次查找）并计算相似度
+        if rows is not None:
+            snapshot = (
+                version,
+                np.array([entry_id for entry_id, _ in rows]),
+                np.stack([vec for _, (vec, _) in rows]),
+                np.array([created for _, (_, created) in rows]),
+            )
+            with self._lock:
+                if self._versions.get(key) == version:
+                    self._matrices[key] = snapshot
+        _, ids, matrix, created = snapshot
+        scores = matrix @ query
+        expired = now - created > self.ttl
+        scores[expired] = -np.inf
+        best = int(np.argmax(scores))
+
+        # 3. 锁内清理过期条目、更新 LRU 并读取回答（条目可能已被淘汰）
+        with self._lock:
+            for entry_id in ids[expired]:
+                self._remove(int(entry_id))
+            answer = None
+            if scores[best] >= self.threshold:
+                best_id = int(ids[best])
+                entry = self._entries.get(best_id)
+                if entry is not None:
+                    self._entries.move_to_end(best_id)  # 更新 LRU 顺序
+                    answer = entry[2]
+        return self._record(answer)
+
+    def _record(self, answer):
+        with self._lock:
+            if answer is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return answer
+
+    def _remove(self, entry_id):
+        """删除条目并使所在分组的矩阵快照失效（调用方持有锁）"""
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        key = entry[0]
+        group = self._groups[key]
+        del group[entry_id]
+        if group:
+            self._versions[key] += 1
+        else:
+            del self._groups[key], self._versions[key]
+            self._matrices.pop(key, None)
+
+    # =================================================
+    # 写入缓存
+    # =================================================
+    def store(self, embedding, namespace, answer):
+        vec = self._normalize(embedding)
+        key = (namespace, vec.shape[0])
+        created = time.time()
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (key, vec, answer, created)
+            self._groups.setdefault(key, {})[entry_id] = (vec, created)
+            self._versions[key] = self._versions.get(key, 0) + 1
+            # 超出容量：淘汰最久未使用的条目
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    # =================================================
+    # 命中统计
+    # =================================================
+    def stats(self):
+        with self._lock:
+            hits, misses, size = self.hits, self.misses, len(self._entries)
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "size": size,
+        }
@@ -0,0 +1,89 @@
+"""
+向量检索性能测试脚本：对比 Chroma HTTP 检索与进程内本地索引检索
+核心功能：
+  1. 从知识块文件（knowledges.jsonl / knowledges.json）抽样知识块文本作为查询（另加若干真实提问）
+  2. 预先计算查询向量（两种方案使用相同向量，只比较检索本身）
+  3. 统计两种方案的 p50/p95 检索延迟，以及 top-k 结果的重合率
+适用场景：决定是否在部署时设置 VECTOR_BACKEND=local
+"""
+
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# 允许直接以脚本方式运行（python utils/性能测试_向量检索.py）
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import chromadb
+from utils.ChunkFile import default_chunks_path, iter_chunks
+from utils.LatencyStats import percentiles
+from utils.LocalVectorIndex import LocalVectorIndex, export_from_collection
+from utils.RAGSystem import RAGSystem
+
+QUERIES = [
+    "苹果的热量是多少",
+    "减脂期晚餐推荐",
+    "早餐吃燕麦和鸡蛋好不好",
+    "糖尿病人可以吃什么水果",
+    "高蛋白食物有哪些",
+]
+SAMPLED_CHUNKS = 45  # 从知识库中抽样的查询条数
+N_RESULTS = 30  # 召回数量（与 retrieval_chunks 的 n_results 一致）
+ROUNDS = 5  # 重复轮数
+
+
+def report(name, latencies):
+    latency_ms = percentiles(latencies, ndigits=2)
+    print(f"📊 {name}: p50={latency_ms['p50']:.2f}ms | p95={latency_ms['p95']:.2f}ms | 样本数={len(latencies)}")
+
+
+def run(collection, embeddings):
+    latencies, results = [], []
+    for _ in range(ROUNDS):
+        results = []
+        for embedding in embeddings:
+            start = time.perf_counter()
+            result = collection.query(query_embeddings=[embedding], n_results=N_RESULTS)
+            latencies.append(time.perf_counter() - start)
+            results.append(result["ids"][0])
+    return latencies, results
+
+
+if __name__ == "__main__":
+    chunks = list(iter_chunks(default_chunks_path(Path(__file__).resolve().parent / "chunks")))
+    print(f"✅ 加载知识库: {len(chunks)} 个知识块")
+
+    rng = random.Random(42)
+    queries = QUERIES + [c["content"][:100] for c in rng.sample(chunks, min(SAMPLED_CHUNKS, len(chunks)))]
+
+    # Chroma HTTP 方案（RAGSystem 默认后端）
+    rag = RAGSystem(backend="chroma")
+    embeddings = [rag.embed_query(q) for q in queries]
+    print(f"✅ 已计算 {len(embeddings)} 个查询向量")
+
+    # 本地索引方案：从同一个 Chroma 集合导出，保证数据一致
+    index_dir = tempfile.mkdtemp(prefix="vector_index_")
+    export_from_collection(
+        chromadb.HttpClient(host="localhost", port=8081).get_collection(name="my_collection"),
+        index_dir=index_dir,
+    )
+    local_index = LocalVectorIndex(index_dir)
+
+    chroma_latencies, chroma_ids = run(rag.collection, embeddings)
+    local_latencies, local_ids = run(local_index, embeddings)
+    report("Chroma HTTP", chroma_latencies)
+    report("本地索引", local_latencies)
+
+    # top-k 重合率：衡量两种方案召回结果是否一致
+    overlap = statistics.mean(
+        len(set(a) & set(b)) / max(len(a), 1) for a, b in zip(chroma_ids, local_ids)
+    )
+    print(f"🔍 top-{N_RESULTS} 重合率: {overlap:.2%}")
+
+    """
+    ⚠️ 注意事项：
+      需先启动 Chroma 服务并导入知识库，且 ./chunks/knowledges.jsonl（或旧的 knowledges.json）存在
+    """
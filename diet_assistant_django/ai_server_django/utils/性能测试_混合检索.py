@@ -0,0 +1,89 @@
+"""
+混合检索评测脚本：对比纯向量召回与 BM25 + 向量（RRF 融合）召回
+核心功能：
+  1. 从知识块文件（knowledges.jsonl / knowledges.json）抽样知识块，截取其中一段文本作为查询，该知识块即标准答案
+  2. 统计送入重排序之前的候选集合 recall@k（标准答案是否出现在前 k 个候选中）
+  3. 统计两种方案的召回延迟 p50/p95
+评估目标：混合检索用更小的候选集合（HYBRID_CANDIDATES）达到不低于纯向量 top-30 的召回率
+"""
+
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# 允许直接以脚本方式运行（python utils/性能测试_混合检索.py）
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.BM25Index import BM25Index, chunk_id
+from utils.ChunkFile import default_chunks_path, iter_chunks
+from utils.LatencyStats import percentiles
+from utils.RAGSystem import RAGSystem, hybrid_candidates
+
+SAMPLES = 100  # 评测查询条数
+N_RESULTS = 30  # 各路召回数量
+KS = [5, 10, 15, 30]  # 统计的 recall@k
+
+
+def report_latency(name, latencies):
+    latency_ms = percentiles(latencies)
+    print(f"⏱️ {name}: p50={latency_ms['p50']:.1f}ms | p95={latency_ms['p95']:.1f}ms")
+
+
+def report_recall(name, hits):
+    line = " | ".join(f"recall@{k}={statistics.mean(h[k] for h in hits):.2%}" for k in KS)
+    print(f"📊 {name}: {line}")
+
+
+def recall_at(ranked_ids, target):
+    return {k: target in ranked_ids[:k] for k in KS}
+
+
+if __name__ == "__main__":
+    chunks_dir = Path(__file__).resolve().parent / "chunks"
+    chunks = list(iter_chunks(default_chunks_path(chunks_dir)))
+    print(f"✅ 加载知识库: {len(chunks)} 个知识块")
+
+    # 构造查询：从知识块中随机截取 12~30 个字符（模拟提到具体食物名称/数字的提问）
+    rng = random.Random(42)
+    queries = []
+    for chunk in rng.sample(chunks, min(SAMPLES, len(chunks))):
+        text = chunk["content"]
+        length = min(len(text), rng.randint(12, 30))
+        start = rng.randint(0, len(text) - length)
+        queries.append((text[start:start + length], chunk_id(chunk)))
+
+    bm25_path = chunks_dir / "bm25_index.json"
+    if not bm25_path.exists():
+        BM25Index().build(chunks).save(bm25_path)
+    rag = RAGSystem(bm25_path=str(bm25_path))
+
+    vector_hits, hybrid_hits = [], []
+    vector_latencies, hybrid_latencies = [], []
+    for question, target in queries:
+        embedding = rag.embed_query(question)  # 预先计算（两种方案共用），只比较召回本身
+
+        start = time.perf_counter()
+        result = rag.collection.query(query_embeddings=[embedding], n_results=N_RESULTS)
+        vector_latencies.append(time.perf_counter() - start)
+        ids = result["ids"][0]
+        vector_hits.append(recall_at(ids, target))
+
+        start = time.perf_counter()
+        fused, _, _ = rag.hybrid_fuse(
+            question, ids, result["documents"][0], result["metadatas"][0], N_RESULTS, N_RESULTS
+        )
+        hybrid_latencies.append(time.perf_counter() - start + vector_latencies[-1])
+        hybrid_hits.append(recall_at(fused, target))
+
+    report_recall("纯向量召回", vector_hits)
+    report_recall("混合召回（RRF）", hybrid_hits)
+    report_latency("纯向量召回", vector_latencies)
+    report_latency("混合召回（RRF）", hybrid_latencies)
+    print(f"💡 当前 HYBRID_CANDIDATES={hybrid_candidates}：重排序候选数从 {N_RESULTS} 降为 {hybrid_candidates}")
+
+    """
+    ⚠️ 注意事项：
+      需先启动 Chroma 服务并导入知识库，且 ./chunks/knowledges.jsonl（或旧的 knowledges.json）存在
+    """
@@ -0,0 +1,98 @@
+"""
+重排序性能测试脚本：对比 BGE 重排序优化前后的延迟
+核心功能：用知识库中的真实知识块构造 (问题, 文档) 对，统计 p50/p95 重排序延迟
+对比方案：
+  1. 优化前：FlagReranker(use_fp16=True) + compute_score 默认参数
+  2. 优化后（冷缓存）：CachedReranker（CPU 配置，不使用得分缓存）
+  3. 优化后（热缓存）：CachedReranker 重复问题命中得分缓存
+适用场景：调整 RERANK_* 环境变量后评估效果
+"""
+
+import random
+import sys
+import time
+from pathlib import Path
+
+# 允许直接以脚本方式运行（python utils/性能测试_重排序.py）
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from FlagEmbedding import FlagReranker
+from utils.ChunkFile import default_chunks_path, iter_chunks
+from utils.LatencyStats import percentiles
+from utils.RAGSystem import CachedReranker, rerank_model
+
+# 测试问题（覆盖简单查询与复杂咨询）
+QUERIES = [
+    "苹果的热量是多少",
+    "减脂期晚餐推荐",
+    "早餐吃燕麦和鸡蛋好不好",
+    "糖尿病人可以吃什么水果",
+    "每天应该喝多少水",
+    "高蛋白食物有哪些",
+    "孕妇饮食需要注意什么",
+    "晚上吃香蕉会长胖吗",
+    "如何搭配一周的健身餐",
+    "豆腐和菠菜能一起吃吗",
+]
+CANDIDATES = 30  # 每个问题的候选文档数（与 retrieval_chunks 的 n_results 一致）
+ROUNDS = 3  # 每个方案重复轮数
+
+
+# ========================
+# 加载知识块作为候选文档
+# ========================
+def load_documents(chunks_path):
+    documents = [chunk["content"] for chunk in iter_chunks(chunks_path)]
+    print(f"✅ 加载知识库: {len(documents)} 个知识块")
+    return documents
+
+
+# ========================
+# 统计工具：p50 / p95（毫秒）
+# ========================
+def report(name, latencies):
+    latency_ms = percentiles(latencies)
+    print(f"📊 {name}: p50={latency_ms['p50']:.1f}ms | p95={latency_ms['p95']:.1f}ms | 样本数={len(latencies)}")
+
+
+def run(score_fn, samples):
+    latencies = []
+    for _ in range(ROUNDS):
+        for question, ids, docs in samples:
+            start = time.perf_counter()
+            score_fn(question, ids, docs)
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+if __name__ == "__main__":
+    documents = load_documents(default_chunks_path(Path(__file__).resolve().parent / "chunks"))
+
+    # 固定随机种子，保证各方案使用相同的候选集合
+    rng = random.Random(42)
+    samples = []
+    for question in QUERIES:
+        idx = rng.sample(range(len(documents)), min(CANDIDATES, len(documents)))
+        samples.append((question, [str(i) for i in idx], [documents[i] for i in idx]))
+
+    # 1. 优化前
+    baseline = FlagReranker(rerank_model, use_fp16=True)
+    report("优化前（FP16 + 默认参数）", run(
+        lambda q, ids, docs: baseline.compute_score([(q, d) for d in docs]),
+        samples,
+    ))
+    del baseline
+
+    # 2. 优化后（冷缓存）
+    cold = CachedReranker(score_cache_size=0)
+    report("优化后（CPU 配置，冷缓存）", run(cold.scores, samples))
+
+    # 3. 优化后（热缓存）：先完整跑一遍预热，再统计
+    warm = CachedReranker()
+    run(warm.scores, samples)
+    report("优化后（CPU 配置，热缓存）", run(warm.scores, samples))
+
+    """
+    ⚠️ 注意事项：
+      需在 asst.env 中配置 RERANK_MODEL，并先生成 ./chunks/knowledges.jsonl
+    """
@@ -1,14 +1,32 @@
 """
 ChromaDB 知识库导入脚本：将预处理的RAG知识块导入向量数据库
-核心功能：将Markdown清洗分割后的JSON知识库转换为ChromaDB可检索的向量数据库
+核心功能：将Markdown清洗分割后的JSONL知识库（兼容旧的JSON数组文件）转换为ChromaDB可检索的向量数据库
 适用场景：RAG系统知识库初始化、知识库更新
+
+增量导入流程（可重复执行，结果一致）：
+  1. 第一遍流式读取知识块，只收集 内容+元数据 的 MD5 id（重复知识块只保留一份）
+  2. 与集合中已有 id 做差集：只向量化新增/变更的知识块，删除已不存在的旧知识块
+  3. 第二遍流式读取，只取出待新增的知识块，分批、有限并发调用 Embedding API，失败按指数退避重试
+     （内存中只保留 id 集合和正在处理的批次，与知识库大小无关）
+  4. 每批向量化后立即写入集合：中断后重新运行时，已写入的知识块在第 2 步的差集中被跳过，自动从断点继续
+  5. 全部新增写入成功后才删除旧知识块：导入中途失败时，集合中仍保留旧版本，线上检索不会缺失内容
 """
 
 import chromadb  # ChromaDB核心库，用于向量数据库操作
 import os  # 操作系统接口，用于环境变量和路径处理
 from chromadb.utils.embedding_functions import OpenAIEmbeddingFunction  # 适配OpenAI嵌入模型的函数
-import json  # JSON数据处理
 import hashlib  # 生成唯一ID的哈希函数
+import random  # 重试退避的随机抖动
+import sys
+import time  # 重试等待
+from concurrent.futures import ThreadPoolExecutor  # 有限并发向量化
+from itertools import islice
+from pathlib import Path
+
+# 允许直接以脚本方式运行（python utils/数据处理_添加到VDB.py）
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.ChunkFile import default_chunks_path, iter_chunks as read_chunks
 
 # ========================
 # 1. 连接到ChromaDB服务器
@@ -23,14 +41,15 @@ chroma_client = chromadb.HttpClient(host="localhost", port=8081)
 # ========================
 # 2. 创建/获取知识库集合
 # ========================
+embedding_function = OpenAIEmbeddingFunction(
+    api_key=os.getenv("DASHSCOPE_API_KEY"),  # 从环境变量获取阿里云DashScope API密钥
+    model_name="text-embedding-v4",  # 使用的嵌入模型（阿里云文本嵌入模型）
+    api_base="https://dashscope.aliyuncs.com/compatible-mode/v1",  # 阿里云DashScope API端点
+    api_type="dashscope"  # 指定API类型为DashScope
+)
 collection = chroma_client.get_or_create_collection(
     name="my_collection",  # 集合名称（知识库标识）
-    embedding_function=OpenAIEmbeddingFunction(
-        api_key=os.getenv("DASHSCOPE_API_KEY"),  # 从环境变量获取阿里云DashScope API密钥
-        model_name="text-embedding-v4",  # 使用的嵌入模型（阿里云文本嵌入模型）
-        api_base="https://dashscope.aliyuncs.com/compatible-mode/v1",  # 阿里云DashScope API端点
-        api_type="dashscope"  # 指定API类型为DashScope
-    )
+    embedding_function=embedding_function,
 )
 """
 - get_or_create_collection: 如果集合已存在则获取，不存在则创建
@@ -43,21 +62,21 @@ collection = chroma_client.get_or_create_collection(
 """
 
 # ========================
-# 3. 加载预处理知识库
+# 导入参数
 # ========================
-if __name__ == "__main__":
-    chunks_path = "./chunks/knowledges.json"  # 预处理知识库JSON文件路径
-
-    # 读取JSON文件
-    with open(chunks_path, "r", encoding="utf-8") as f:
-        chunks = json.load(f)  # 加载为Python字典列表
-        print(f"✅ 加载知识库: {len(chunks)} 个知识块")  # 确认加载数量
+EMBED_BATCH_SIZE = 10  # 每次 Embedding API 调用的文本条数（DashScope 单次上限为 10）
+EMBED_CONCURRENCY = 4  # 同时进行的 Embedding API 调用数
+MAX_RETRIES = 5  # 单批最大重试次数
+PAGE_SIZE = 1000  # 分页读取集合已有 id / 分批删除的条数
 
-    # 初始化存储列表
-    ids, documents, metadatas = [], [], []
 
-    # 遍历每个知识块
-    for chunk in chunks:
+# ========================
+# 3. 逐条读取知识块
+# ========================
+def iter_chunks(chunks_path):
+    """逐条产出 (id, 知识块)，同一 id 只产出一次（JSONL 逐行读取，旧 JSON 文件整体加载）"""
+    seen = set()
+    for chunk in read_chunks(chunks_path):
         # 生成唯一ID（防止重复添加）
         # 1. 拼接内容+元数据（确保不同内容/元数据组合有唯一ID）
         # 2. MD5哈希（128位哈希，足够唯一且高效）
@@ -65,25 +84,100 @@ if __name__ == "__main__":
         unique_id = hashlib.md5(
             (chunk["content"] + str(chunk["metadata"])).encode('utf-8')
         ).hexdigest()
-        ids.append(unique_id)
+        if unique_id in seen:
+            continue
+        seen.add(unique_id)
+        yield unique_id, chunk
 
-        # 提取文档内容
-        documents.append(chunk["content"])
 
-        # 提取元数据（如来源文件、部门等）
-        metadatas.append(chunk["metadata"])
+# ========================
+# 4. 读取集合中已有的全部 id（分页，只取 id 不取向量）
+# ========================
+def existing_ids():
+    ids = set()
+    offset = 0
+    while True:
+        page = collection.get(include=[], limit=PAGE_SIZE, offset=offset)
+        if not page["ids"]:
+            break
+        ids.update(page["ids"])
+        offset += len(page["ids"])
+    return ids
 
-    # ========================
-    # 4. 将数据添加到ChromaDB
-    # ========================
-    collection.add(
-        ids=ids,  # 唯一ID列表
-        documents=documents,  # 文本内容列表
-        metadatas=metadatas,  # 元数据列表（用于后续过滤）
-    )
+
+# ========================
+# 5. 向量化（指数退避 + 随机抖动重试）
+# ========================
+def embed_with_retry(documents):
+    for attempt in range(MAX_RETRIES):
+        try:
+            return [list(map(float, e)) for e in embedding_function(documents)]
+        except Exception as e:
+            if attempt == MAX_RETRIES - 1:
+                raise
+            wait = (2 ** attempt) + random.uniform(0, 1)
+            print(f"⚠️ 向量化失败（第 {attempt + 1} 次）: {e}，{wait:.1f} 秒后重试")
+            time.sleep(wait)
+
+
+def batched(items, size):
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+# ========================
+# 6. 增量导入
+# ========================
+def ingest(chunks_path):
+    # 6.1 差集计算（第一遍只收集 id）：上次中断前已写入的知识块也在集合中，直接跳过
+    current = existing_ids()
+    source = {unique_id for unique_id, _ in iter_chunks(chunks_path)}
+    to_add = source - current
+    to_delete = [i for i in current if i not in source]
+    print(f"✅ 知识库: {len(source)} 个知识块 | 已存在: {len(current)} | "
+          f"待新增: {len(to_add)} | 待删除: {len(to_delete)}")
+
+    # 6.2 新知识块：第二遍流式读取，有限并发向量化，按提交顺序写入集合
+    # 每次最多提交 EMBED_CONCURRENCY 批，避免一次性把所有批次放进内存
+    pending = ((i, chunk) for i, chunk in iter_chunks(chunks_path) if i in to_add)
+    batches = batched(pending, EMBED_BATCH_SIZE)
+    added = 0
+    with ThreadPoolExecutor(max_workers=EMBED_CONCURRENCY) as executor:
+        for window in batched(batches, EMBED_CONCURRENCY):
+            futures = [
+                (batch, executor.submit(embed_with_retry, [chunk["content"] for _, chunk in batch]))
+                for batch in window
+            ]
+            for batch, future in futures:
+                embeddings = future.result()
+                ids = [i for i, _ in batch]
+                collection.add(
+                    ids=ids,  # 唯一ID列表
+                    documents=[chunk["content"] for _, chunk in batch],  # 文本内容列表
+                    metadatas=[chunk["metadata"] for _, chunk in batch],  # 元数据列表（用于后续过滤）
+                    embeddings=embeddings,  # 预先计算的向量
+                )
+                added += len(ids)
+            print(f"⏳ 已写入 {added}/{len(to_add)} 个知识块")
+
+    # 6.3 新增全部成功后，再删除已不存在的旧知识块（内容变更后旧 id 也在此删除）
+    # 向量化失败或进程被中断时不会执行到这里，线上检索仍能查到旧版本
+    for batch in batched(to_delete, PAGE_SIZE):
+        collection.delete(ids=batch)
+
+    return added, len(to_delete)
+
+
+# ========================
+# 7. 执行导入
+# ========================
+if __name__ == "__main__":
+    chunks_path = default_chunks_path("./chunks")  # 预处理知识库文件路径（优先 knowledges.jsonl，兼容旧的 knowledges.json）
+
+    added, deleted = ingest(chunks_path)
 
     # ========================
-    # 5. 确认导入结果
+    # 8. 确认导入结果
     # ========================
-    print(f"📊 知识库统计: {collection.count()} 个文档已导入")  # 打印集合中文档总数
-    print(f"🔍 首个文档示例: {documents[0][:50]}...")  # 打印第一个文档的前50字符
\ No newline at end of file
+    print(f"📊 知识库统计: 新增 {added} | 删除 {deleted} | 集合中共 {collection.count()} 个文档")  # 打印集合中文档总数
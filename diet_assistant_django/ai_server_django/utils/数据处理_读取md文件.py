@@ -1,12 +1,25 @@
 """
 RAG知识库预处理模块：将Markdown文档清洗、语义分割、合并后生成结构化知识块
-核心流程：格式清洗 → 语义分割 → 分块优化 → JSON持久化
+核心流程：格式清洗 → 语义分割 → 分块优化 → JSONL流式持久化（每处理完一个文件即写入）
+并行模式：workers > 1 时按文件分发到进程池（每个进程只加载一次分割模型），按文件顺序合并结果
+分割缓存：按 文件内容哈希 + 模型路径 + 分割参数 缓存每个文件的合并结果，未变化的文件直接复用
+长文档窗口：超过 window_size 的文档在标题处切成带重叠的窗口，分批送入模型，再按窗口归属拼接分割点
 适用场景：构建高质量RAG知识库前的数据预处理
 """
 
+import hashlib
 import json
+import os
 import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+
+# 允许直接以脚本方式运行（python utils/数据处理_读取md文件.py）
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.ChunkFile import ChunkWriter
 from modelscope.outputs import OutputKeys
 from modelscope.pipelines import pipeline
 from modelscope.utils.constant import Tasks
@@ -18,21 +31,31 @@ class MarkdownRAGProcessor:
     功能：清洗Markdown噪声 → 调用语义分割模型 → 合并短文本块 → 生成标准化知识库JSON
     """
 
-    def __init__(self, model_path="./segmentation-models", min_chunk_length=120):
+    def __init__(self, model_path="./segmentation-models", min_chunk_length=120, workers=1,
+                 cache_dir="./chunks/.segment_cache", window_size=3000, window_overlap=300,
+                 window_batch_size=8):
         """
         初始化处理器
 
         Args:
             model_path (str): ModelScope文档分割模型本地路径（需提前下载）
             min_chunk_length (int): 合并后单个知识块的最小字符长度（防碎片化）
+            workers (int): 并行进程数；1 表示在当前进程内逐个文件处理
+            cache_dir (str | None): 分割结果缓存目录；None 表示不使用缓存
+            window_size (int): 单个窗口核心区间的最大字符数；超过该长度的文档按窗口分割，0 表示整篇送入模型
+            window_overlap (int): 相邻窗口两侧各附加的上下文字符数（按整行取齐）
+            window_batch_size (int): 每次送入模型的窗口数
         """
-        # 加载ModelScope文档语义分割pipeline（支持中文文档结构理解）
-        self.pipeline = pipeline(
-            task=Tasks.document_segmentation,  # 任务类型：文档分割
-            model=model_path,  # 模型路径
-            model_revision="master",  # 模型版本
-        )
+        self.model_path = model_path
         self.min_chunk_length = min_chunk_length
+        self.workers = workers
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.window_size = window_size
+        self.window_overlap = window_overlap
+        self.window_batch_size = max(window_batch_size, 1)
+        # ModelScope文档语义分割pipeline：首次分割时才加载
+        # （全部命中缓存时无需加载模型；并行模式下由各工作进程自行加载）
+        self.pipeline = None
 
         # 占位符设计说明：
         # - 移除句号保护（__DOT__）：保留原始标点利于模型识别语义边界
@@ -134,81 +157,323 @@ class MarkdownRAGProcessor:
                 merged.append(current.strip())
         return merged
 
+    def _load_pipeline(self):
+        """加载ModelScope文档语义分割pipeline（支持中文文档结构理解），只加载一次"""
+        if self.pipeline is None:
+            self.pipeline = pipeline(
+                task=Tasks.document_segmentation,  # 任务类型：文档分割
+                model=self.model_path,  # 模型路径
+                model_revision="master",  # 模型版本
+            )
+        return self.pipeline
+
+    def _cache_key(self, content):
+        """
+        缓存键：文件内容 + 模型路径 + min_chunk_length + 窗口参数 的 SHA-256
+
+        任一变化都会得到新键，旧缓存自然失效
+        """
+        key = f"{self.model_path}|{self.min_chunk_length}|{self.window_size}|{self.window_overlap}|{content}"
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _load_cache(self, content):
+        """读取缓存的合并结果，未命中返回 None"""
+        if self.cache_dir is None:
+            return None
+        cache_file = self.cache_dir / f"{self._cache_key(content)}.json"
+        if not cache_file.exists():
+            return None
+        with open(cache_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_cache(self, content, chunks):
+        """写入缓存（先写临时文件再原子替换，并行写入互不干扰）"""
+        if self.cache_dir is None:
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        cache_file = self.cache_dir / f"{self._cache_key(content)}.json"
+        tmp_file = cache_file.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(chunks, f, ensure_ascii=False)
+        os.replace(tmp_file, cache_file)
+
+    def process_file(self, file_path):
+        """
+        处理单个Markdown文件：清洗→保护→语义分割→恢复→二次清洗→合并
+        内容未变化时直接返回缓存结果
+
+        Args:
+            file_path (Path): Markdown文件路径
+        Returns:
+            List[str]: 合并优化后的文本块列表
+        """
+        # ============ 步骤1：读取原始Markdown ============
+        with open(file_path, "r", encoding="utf-8") as f:
+            content = f.read()
+
+        cached = self._load_cache(content)
+        if cached is not None:
+            return cached
+
+        merged = self.segment_content(content)
+        self._save_cache(content, merged)
+        return merged
+
+    def segment_content(self, content):
+        """
+        对单篇Markdown文本执行分割流程（不经过缓存）
+
+        Args:
+            content (str): 原始Markdown文本
+        Returns:
+            List[str]: 合并优化后的文本块列表
+        """
+        # ============ 步骤2：预处理与语义分割 ============
+        if self.window_size and len(content) > self.window_size:
+            # 长文档：窗口分割（结果同样为保护换行符后的文本块）
+            raw_chunks = self._segment_windowed(content)
+        else:
+            # 2.1 保护换行符（防pipeline误分割）
+            protected = self._protect_text(content)
+            # 2.2 调用ModelScope文档分割模型（核心：按语义切分）
+            # 2.3 获取分割结果（ModelScope返回格式：OutputKeys.TEXT）
+            raw_chunks = self._segment_batch([protected])[0]
+
+        # ============ 步骤3：后处理每个分块 ============
+        cleaned_chunks = []
+        for chunk in raw_chunks:
+            # 3.1 恢复文本（换行符→空格）
+            restored = self._restore_text(chunk)
+            # 3.2 二次清洗（移除分割后残留噪声）
+            final_text = self._clean_markdown(restored)
+            if final_text:  # 丢弃空块
+                cleaned_chunks.append(final_text)
+
+        # ============ 步骤4：合并优化 ============
+        return self.merge_chunks(cleaned_chunks)
+
+    def _segment_batch(self, texts):
+        """
+        批量调用分割模型，返回每段文本的分割结果（List[List[str]]）
+
+        pipeline 接收列表时按批推理；若返回格式无法识别，则退回逐条调用
+        """
+        seg = self._load_pipeline()
+        results = seg(documents=texts) if len(texts) > 1 else [seg(documents=texts[0])]
+        if isinstance(results, dict):
+            # 部分版本对列表输入返回 {TEXT: [每段结果]}
+            results = results[OutputKeys.TEXT] if isinstance(results[OutputKeys.TEXT], list) else None
+            results = [{OutputKeys.TEXT: text} for text in results] if results is not None else None
+        if not isinstance(results, list) or len(results) != len(texts):
+            results = [seg(documents=text) for text in texts]
+        return [result[OutputKeys.TEXT].strip().split("\n") for result in results]
+
+    def _split_units(self, content):
+        """
+        将文档切成不超过 window_size 的连续片段（返回 [(起, 止), ...]，覆盖全文）
+
+        优先在标题行前切分；单个章节过长时依次退到空行、换行处切分，实在没有则硬切
+        """
+        starts = [0] + [m.start() for m in re.finditer(r"(?m)^#{1,6}\s", content) if m.start() > 0]
+        units = []
+        for start, end in zip(starts, starts[1:] + [len(content)]):
+            while end - start > self.window_size:
+                limit = start + self.window_size
+                cut = content.rfind("\n\n", start + 1, limit)
+                if cut < 0:
+                    cut = content.rfind("\n", start + 1, limit)
+                cut = cut + 1 if cut >= 0 else limit
+                units.append((start, cut))
+                start = cut
+            units.append((start, end))
+        return units
+
+    def _build_windows(self, content):
+        """
+        将片段按顺序装入窗口，返回 [(核心起, 核心止, 窗口起, 窗口止), ...]
+
+        - 核心区间互不重叠且覆盖全文，由该窗口负责其中的分割点
+        - 窗口在核心两侧各扩展约 window_overlap 个字符（取齐到整行），为模型提供上下文
+        """
+        cores = []
+        for start, end in self._split_units(content):
+            if cores and end - cores[-1][0] <= self.window_size:
+                cores[-1][1] = end
+            else:
+                cores.append([start, end])
+
+        windows = []
+        for core_start, core_end in cores:
+            left = max(core_start - self.window_overlap, 0)
+            left = content.rfind("\n", 0, left) + 1 if left > 0 else 0
+            right = min(core_end + self.window_overlap, len(content))
+            newline = content.find("\n", right)
+            right = newline + 1 if right < len(content) and newline >= 0 else len(content)
+            windows.append((core_start, core_end, min(left, core_start), max(right, core_end)))
+        return windows
+
+    def _segment_windowed(self, content):
+        """
+        长文档窗口分割：窗口分批送入模型，各窗口只保留核心区间内的分割点，再在原文上统一切分
+
+        - 对齐方式：模型只插入分割，不改写文字，按非空白字符计数把每段结果映射回原文位置
+        - 拼接：跨窗口边界的句段不会被强行切断，是否切分由拥有该位置的窗口决定
+        - 内存与耗时只随窗口数线性增长
+        """
+        windows = self._build_windows(content)
+        cuts = []
+        for i in range(0, len(windows), self.window_batch_size):
+            batch = windows[i:i + self.window_batch_size]
+            segmented = self._segment_batch([self._protect_text(content[w[2]:w[3]]) for w in batch])
+            for (core_start, core_end, win_start, win_end), chunks in zip(batch, segmented):
+                # 窗口内非空白字符的原文位置
+                positions = [win_start + j for j, ch in enumerate(content[win_start:win_end]) if not ch.isspace()]
+                count = 0
+                for chunk in chunks[:-1]:
+                    count += sum(1 for ch in chunk.replace(self.newline_placeholder, "\n") if not ch.isspace())
+                    if count >= len(positions):
+                        break
+                    cut = positions[count]  # 下一段首字符位置
+                    if core_start <= cut < core_end and cut > 0:
+                        cuts.append(cut)
+
+        bounds = [0] + sorted(set(cuts)) + [len(content)]
+        return [self._protect_text(content[a:b]) for a, b in zip(bounds, bounds[1:])]
+
+    def _iter_results(self, files):
+        """
+        按文件顺序产出 (文件路径, 知识块列表或异常, 耗时秒数, 文件字节数)，命中缓存的文件耗时为 None
+
+        - 先在主进程检查缓存，命中的文件不再分发
+        - 串行模式：当前进程逐个处理未命中的文件
+        - 并行模式：进程池并行处理未命中的文件，map 保证结果按提交顺序返回（结果确定）
+        """
+        cached, pending = {}, []
+        for file_path in files:
+            try:
+                with open(file_path, "r", encoding="utf-8") as f:
+                    chunks = self._load_cache(f.read())
+            except Exception:
+                chunks = None  # 读取失败交给 process_file 报告错误
+            if chunks is not None:
+                cached[file_path] = (chunks, None, file_path.stat().st_size)
+            else:
+                pending.append(file_path)
+        if files:
+            print(f"♻️ 分割缓存命中 {len(cached)}/{len(files)} 个文件")
+
+        if self.workers <= 1 or not pending:
+            results = (_timed_process(self, file_path) for file_path in pending)
+            for file_path in files:
+                yield (file_path, *(cached[file_path] if file_path in cached else next(results)))
+            return
+
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,  # 每个工作进程只加载一次分割模型
+            initargs=(self.model_path, self.min_chunk_length, self.cache_dir,
+                      self.window_size, self.window_overlap, self.window_batch_size),
+        ) as executor:
+            results = executor.map(_process_in_worker, pending)
+            for file_path in files:
+                yield (file_path, *(cached[file_path] if file_path in cached else next(results)))
+
     def process_files(self, input_dir, output_file):
         """
-        批量处理Markdown文件并生成知识库JSON
+        批量处理Markdown文件并生成知识库JSONL
 
         流程：
-        1. 遍历目录下所有.md文件
-        2. 单文件处理：清洗→保护→语义分割→恢复→二次清洗→合并
+        1. 遍历目录下所有.md文件（按文件名排序，保证输出顺序稳定）
+        2. 单文件处理（process_file），并行模式下分发到进程池
         3. 构建带元数据的知识块
-        4. 持久化为标准JSON
+        4. 逐个文件追加写入JSONL（每行一个知识块），不在内存中累积全部知识块
 
         Args:
             input_dir (str): Markdown源文件目录路径
-            output_file (str): 输出JSON文件路径
+            output_file (str): 输出JSONL文件路径（先写入 .partial，全部完成后替换）
         """
         input_path = Path(input_dir)
         if not input_path.exists():
             print(f"❌ 错误：目录 {input_dir} 不存在")
             return
 
-        knowledges = []  # 存储所有知识块
-        files = list(input_path.glob("*.md"))
+        files = sorted(input_path.glob("*.md"))
 
-        print(f"📁 开始处理 {len(files)} 个Markdown文件...")
+        print(f"📁 开始处理 {len(files)} 个Markdown文件（进程数: {max(self.workers, 1)}）...")
+        start_time = time.perf_counter()
+        total_bytes = 0  # 实际分割的文件字节数（命中缓存的文件不计入吞吐量）
+        segmented, cache_hits = 0, 0
+        min_length, max_length = None, 0  # 知识块长度统计（流式累计）
 
-        for file_path in files:
-            try:
-                # ============ 步骤1：读取原始Markdown ============
-                with open(file_path, "r", encoding="utf-8") as f:
-                    content = f.read()
-
-                # ============ 步骤2：预处理与语义分割 ============
-                # 2.1 保护换行符（防pipeline误分割）
-                protected = self._protect_text(content)
-                # 2.2 调用ModelScope文档分割模型（核心：按语义切分）
-                result = self.pipeline(documents=protected)
-                # 2.3 获取分割结果（ModelScope返回格式：OutputKeys.TEXT）
-                raw_chunks = result[OutputKeys.TEXT].strip().split("\n")
-
-                # ============ 步骤3：后处理每个分块 ============
-                cleaned_chunks = []
-                for chunk in raw_chunks:
-                    # 3.1 恢复文本（换行符→空格）
-                    restored = self._restore_text(chunk)
-                    # 3.2 二次清洗（移除分割后残留噪声）
-                    final_text = self._clean_markdown(restored)
-                    if final_text:  # 丢弃空块
-                        cleaned_chunks.append(final_text)
-
-                # ============ 步骤4：合并优化 ============
-                merged_chunks = self.merge_chunks(cleaned_chunks)
-
-                # ============ 步骤5：构建知识库条目 ============
+        with ChunkWriter(output_file) as writer:
+            for file_path, merged_chunks, elapsed, size in self._iter_results(files):
+                if isinstance(merged_chunks, Exception):
+                    e = merged_chunks
+                    print(f"⚠️ 处理文件 {file_path.name} 时出错: {type(e).__name__}: {e}")
+                    continue
+
+                # ============ 步骤5：构建知识库条目并写入 ============
                 for chunk in merged_chunks:
-                    knowledges.append({
+                    writer.write({
                         "metadata": {
                             "source": file_path.name,  # 保留来源文件名（溯源关键）
                             "department": "",  # 预留部门字段（便于后续扩展）
                         },
                         "content": chunk,  # 清洗合并后的有效文本
                     })
-                print(f"✅ 成功处理: {file_path.name} → 生成 {len(merged_chunks)} 个知识块")
-
-            except Exception as e:
-                print(f"⚠️ 处理文件 {file_path.name} 时出错: {type(e).__name__}: {e}")
-
-        # ============ 步骤6：持久化输出 ============
-        output_path = Path(output_file)
-        output_path.parent.mkdir(parents=True, exist_ok=True)  # 确保输出目录存在
-        with open(output_path, "w", encoding="utf-8") as f:
-            # ensure_ascii=False：保留中文；indent=4：美化格式便于人工检查
-            json.dump(knowledges, f, ensure_ascii=False, indent=4)
-        print(f"\n✨ 所有任务完成！共生成 {len(knowledges)} 个知识块")
+                    min_length = len(chunk) if min_length is None else min(min_length, len(chunk))
+                    max_length = max(max_length, len(chunk))
+                writer.flush()  # 每个文件处理完即刷盘
+                if elapsed is None:
+                    cache_hits += 1
+                    print(f"✅ 成功处理: {file_path.name} → 生成 {len(merged_chunks)} 个知识块 | cached")
+                    continue
+                segmented += 1
+                total_bytes += size
+                print(f"✅ 成功处理: {file_path.name} → 生成 {len(merged_chunks)} 个知识块 | "
+                      f"耗时 {elapsed:.2f}s | {size / max(elapsed, 1e-6):.0f} 字节/秒")
+
+        total_elapsed = time.perf_counter() - start_time
+        print(f"\n✨ 所有任务完成！共生成 {writer.count} 个知识块")
         print(f"💾 结果已保存至: {output_file}")
-        print(f"📊 知识块统计: 最小长度={min(len(k['content']) for k in knowledges)} | "
-              f"最大长度={max(len(k['content']) for k in knowledges)}")
+        print(f"⏱️ 总耗时 {total_elapsed:.2f}s | 分割 {segmented} 个文件，命中缓存 {cache_hits} 个")
+        if segmented:
+            # 吞吐量只统计实际分割的文件
+            print(f"🚀 分割吞吐量: {segmented / max(total_elapsed, 1e-6):.2f} 文件/秒 | "
+                  f"{total_bytes / max(total_elapsed, 1e-6):.0f} 字节/秒")
+        if writer.count:
+            print(f"📊 知识块统计: 最小长度={min_length} | 最大长度={max_length}")
+
+
+# ============ 并行模式：工作进程函数（需为模块级函数才能被进程池序列化） ============
+_worker_processor = None  # 每个工作进程内的处理器实例
+
+
+def _init_worker(model_path, min_chunk_length, cache_dir, window_size, window_overlap, window_batch_size):
+    global _worker_processor
+    _worker_processor = MarkdownRAGProcessor(
+        model_path=model_path,
+        min_chunk_length=min_chunk_length,
+        cache_dir=cache_dir,
+        window_size=window_size,
+        window_overlap=window_overlap,
+        window_batch_size=window_batch_size,
+    )
+
+
+def _timed_process(processor, file_path):
+    """处理单个文件并计时；出错时返回异常对象而不是抛出（不影响其他文件）"""
+    start = time.perf_counter()
+    try:
+        size = file_path.stat().st_size
+        chunks = processor.process_file(file_path)
+    except Exception as e:
+        return e, time.perf_counter() - start, 0
+    return chunks, time.perf_counter() - start, size
+
+
+def _process_in_worker(file_path):
+    return _timed_process(_worker_processor, file_path)
 
 
 if __name__ == "__main__":
@@ -217,15 +482,20 @@ if __name__ == "__main__":
     1. 确保已下载ModelScope文档分割模型至 ./segmentation-models
        （推荐模型：damo/nlp_bert_document-segmentation_chinese-base）
     2. 将待处理Markdown文件放入 ./ragdatasets 目录
-    3. 运行后生成 ./chunks/knowledges.json 供RAG系统使用
+    3. 运行后生成 ./chunks/knowledges.jsonl 供RAG系统使用（每行一个知识块）
     """
     processor = MarkdownRAGProcessor(
         model_path="./segmentation-models",  # 可替换为ModelScope模型ID（需联网）
-        min_chunk_length=120  # 根据embedding模型调整（如text2vec建议100-300）
+        min_chunk_length=120,  # 根据embedding模型调整（如text2vec建议100-300）
+        workers=1,  # 并行进程数（每个进程各加载一份模型，按内存大小调整）
+        cache_dir="./chunks/.segment_cache",  # 分割结果缓存目录（None 表示不缓存）
+        window_size=3000,  # 超过该字符数的文档按窗口分割（0 表示整篇送入模型）
+        window_overlap=300,  # 窗口两侧的上下文重叠字符数
+        window_batch_size=8,  # 每批送入模型的窗口数
     )
     processor.process_files(
         input_dir="./ragdatasets",
-        output_file="./chunks/knowledges.json"
+        output_file="./chunks/knowledges.jsonl"
     )
 
     """